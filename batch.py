@@ -0,0 +1,191 @@
+"""
+Batch module
+
+This is where the shortest paths from many sources are computed at once, on a pool \
+    of processes sharing a read-only array snapshot of the graph
+"""
+
+import math
+import os
+from array import array
+from multiprocessing import Pool, shared_memory, util
+
+from controllers import dijkstra_snapshot, snapshot_path
+from models import Connection, Graph, GraphSnapshot, Node, numpy
+
+# below this many sources, starting worker processes costs more than it saves
+MIN_PARALLEL_SOURCES = 8
+
+
+class SharedSnapshot:
+    """
+    Read-only CSR arrays of a graph snapshot, as seen by the worker processes.
+
+    It has the attributes dijkstra_snapshot reads (offsets, targets, weights, edge_ids \
+        and its length), each a memoryview on one shared memory block.
+    """
+    def __init__(self, block, size: int, slots: int):
+        self._block = block
+        self._size = size
+        # the arrays follow each other in the block, see create
+        start, length = 8 * (size + 1), 8 * slots
+        self.offsets = block.buf[:start].cast('q')
+        self.targets = block.buf[start:start + length].cast('q')
+        self.edge_ids = block.buf[start + length:start + 2 * length].cast('q')
+        self.weights = block.buf[start + 2 * length:start + 3 * length].cast('d')
+
+    @staticmethod
+    def create(snapshot: GraphSnapshot):
+        """
+        This method copies the arrays of a snapshot into a new shared memory block and \
+            returns it, the caller being in charge of unlinking it.
+        """
+        arrays = (snapshot.offsets, snapshot.targets, snapshot.edge_ids, snapshot.weights)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(1, sum(8 * len(values) for values in arrays)))
+        start = 0
+        for values in arrays:
+            data = values.tobytes()
+            block.buf[start:start + len(data)] = data
+            start += len(data)
+        return block
+
+    def release(self):
+        """
+        This method releases the views and detaches from the shared memory block.
+        """
+        for view in (self.offsets, self.targets, self.edge_ids, self.weights):
+            view.release()
+        self._block.close()
+
+    def __len__(self):
+        return self._size
+
+
+# the snapshot of the worker process and whether paths are sent back, see _attach
+_WORKER = {}
+
+
+def _attach(name: str, size: int, slots: int, paths: bool):
+    _WORKER['snapshot'] = SharedSnapshot(shared_memory.SharedMemory(name=name), size, slots)
+    _WORKER['paths'] = paths
+    util.Finalize(None, _WORKER['snapshot'].release, exitpriority=10)
+
+
+def _solve(source: int) -> tuple:
+    distances, pred_edges = dijkstra_snapshot(_WORKER['snapshot'], source)
+    # the predecessors are only pickled back when they were asked for
+    return source, distances, pred_edges if _WORKER['paths'] else None
+
+
+class DistanceMatrix:
+    """
+    Distances from a list of sources to every node of a snapshot.
+
+    Row i of the matrix holds the distances from sources[i], in the order of the \
+        snapshot nodes, in one flat array('d'). When paths were asked for, pred_edges \
+        holds in the same layout the index of the connection each node was reached \
+        through (-1 for the source and the unreached nodes).
+    """
+    def __init__(self, snapshot: GraphSnapshot, sources, distances, pred_edges=None):
+        self.snapshot = snapshot
+        self.sources = tuple(sources)
+        self.distances = distances
+        self.pred_edges = pred_edges
+        self._rows = {source: i * len(snapshot) for i, source in enumerate(self.sources)}
+
+    @property
+    def shape(self) -> tuple:
+        """
+        This property returns the (sources, nodes) size of the matrix.
+        """
+        return (len(self.sources), len(self.snapshot))
+
+    def row(self, source: Node):
+        """
+        This method returns the distances from a source node to the snapshot nodes.
+        """
+        start = self._rows[source]
+        return self.distances[start:start + len(self.snapshot)]
+
+    def distance(self, source: Node, dest: Node):
+        """
+        This method returns the distance between a source node and a node \
+            (math.inf if it can not be reached).
+        """
+        return self.distances[self._rows[source] + self.snapshot.index_of(dest)]
+
+    def path(self, source: Node, dest: Node) -> list[Connection]:
+        """
+        This method returns the path between a source node and a node ordered like \
+            the result of find_path (None if it can not be reached).
+        """
+        if self.pred_edges is None:
+            raise ValueError('the matrix was computed without paths')
+        return snapshot_path(self.snapshot, self.pred_edges, source, dest, self._rows[source])
+
+    def as_numpy(self):
+        """
+        This method returns the distances as a read-only numpy matrix sharing the \
+            matrix memory.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required to export a matrix as a numpy array')
+        matrix = numpy.frombuffer(memoryview(self.distances).toreadonly(), dtype='d')
+        return matrix.reshape(self.shape)
+
+
+def iter_rows(snapshot: GraphSnapshot, sources, processes=None, paths=True):
+    """
+    This function yields a (source, distances, pred_edges) tuple per source node index, \
+        in completion order, computed as described in many_sources. pred_edges is None \
+        unless paths is set.
+    """
+    if processes == 1 or len(sources) < MIN_PARALLEL_SOURCES:
+        for source in sources:
+            distances, pred_edges = dijkstra_snapshot(snapshot, source)
+            yield source, distances, pred_edges if paths else None
+        return
+
+    block = SharedSnapshot.create(snapshot)
+    try:
+        with Pool(processes, _attach,
+                  (block.name, len(snapshot), len(snapshot.targets), paths)) as pool:
+            chunksize = max(1, len(sources) // (4 * (processes or os.cpu_count() or 1)))
+            yield from pool.imap_unordered(_solve, sources, chunksize)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def many_sources(graph: Graph, sources, processes=None, paths=False) -> DistanceMatrix:
+    """
+    This function computes the distances from every source node to every node of the \
+        graph and returns them as a DistanceMatrix (with the paths if asked for).
+
+    The graph is frozen into a snapshot whose arrays are copied once into shared \
+        memory; the sources are then spread over a pool of processes (os.cpu_count() \
+        by default) which run dijkstra_snapshot on it. Small batches and processes=1 \
+        are computed in the current process.
+    """
+    snapshot = graph.freeze()
+    rows = [snapshot.index_of(source) for source in dict.fromkeys(sources)]
+    size = len(snapshot)
+    distances = array('d', [math.inf]) * (len(rows) * size)
+    pred_edges = array('q', [-1]) * (len(rows) * size) if paths else None
+    row_of = {source: i for i, source in enumerate(rows)}
+    for source, row_distances, row_preds in iter_rows(snapshot, rows, processes, paths):
+        start = row_of[source] * size
+        distances[start:start + size] = row_distances
+        if paths:
+            pred_edges[start:start + size] = row_preds
+    return DistanceMatrix(snapshot, (snapshot.nodes[source] for source in rows), distances,
+                          pred_edges)
+
+
+def all_pairs(graph: Graph, processes=None, paths=False) -> DistanceMatrix:
+    """
+    This function computes the distances between all the nodes of the graph, see \
+        many_sources.
+    """
+    return many_sources(graph, graph.nodes, processes, paths)
@@ -4,8 +4,14 @@ Controllers module
 This is where we find the dijkstra methods
 """
 
+import heapq
 import math
-from models import Connection, Node, Graph
+from array import array
+import sys
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from models import Connection, Node, Graph, GraphSnapshot
 
 
 def init(graph: Graph, start_node: Node):
@@ -15,6 +21,8 @@ def init(graph: Graph, start_node: Node):
     for node in graph.nodes:
         graph.distances[node] = math.inf
     graph.distances[start_node] = 0
+    graph.preds.clear()
+    graph.source = None
 
 
 def search_min(graph: Graph, queue: list) -> Node:
@@ -33,8 +41,26 @@ def find_min_distance(graph: Graph, node1: Node, node2: Node) -> int:
     """
     This function returns the minimum distance from node1 to node2
     """
-    dijkstra(graph, node1)
-    return graph.distances[node2]
+    if not graph.connected(node1, node2):
+        return math.inf
+    precomputed = graph.precomputed
+    if precomputed is not None and precomputed.covers(graph, node1):
+        return precomputed.distance(node1, node2)
+    return shortest_path(graph, node1, node2)[0]
+
+
+def find_min_distances(graph: Graph, node1: Node, targets) -> dict:
+    """
+    This function returns the minimum distances from node1 to each of the target nodes
+        :param graph: graph
+        :param node1: start node
+        :param targets: destination nodes
+        :return: a {target: distance} dictionary
+        :rtype: dict
+    """
+    reachable = [target for target in targets if graph.connected(node1, target)]
+    result = search(graph, node1, reachable) if reachable else None
+    return {target: result.distance(target) if result else math.inf for target in targets}
 
 def get_weight(graph: Graph, node1: Node, node2: Node) -> int:
     """
@@ -48,12 +74,10 @@ def get_weight(graph: Graph, node1: Node, node2: Node) -> int:
         :return: the weight between node1 and node2
         :rtype: int
     """
-    weight = -1
-    for connection in graph.connections:
-        if (connection.nodes[0] == node1 and connection.nodes[1] == node2) or \
-                (connection.nodes[0] == node2 and connection.nodes[1] == node1):
-            weight = connection.weight
-    return weight
+    connection = graph.connection_between(node1, node2)
+    if connection is None:
+        return -1
+    return connection.weight
 
 
 def update_distances(graph: Graph, node: Node):
@@ -64,46 +88,884 @@ def update_distances(graph: Graph, node: Node):
         :type G: Graph
         :type node: Node
     """
-    for node_x, _ in node.neighbors:
-        weight_x = get_weight(graph, node, node_x)
+    for node_x, connection in node.neighbors:
+        weight_x = connection.weight
 
         if graph.distances[node_x] > graph.distances[node] + weight_x:
             graph.distances[node_x] = graph.distances[node] + weight_x
-            graph.preds[node_x] = node
+            graph.preds[node_x] = connection
+
+
+class ShortestPaths:
+    """
+    Immutable result of a single-source shortest-path search.
+
+    distances and preds are read-only mappings of the reached nodes to their distance \
+        and to the connection they were reached through. Nothing is shared with the \
+        graph, so any number of searches can run and be read concurrently.
+    """
+    __slots__ = ('_source', '_distances', '_preds', '_settled', '_complete', '_version')
+
+    # the options are keyword-only so that calls stay readable
+    def __init__(self, source: Node, distances: dict,  # pylint: disable=too-many-arguments
+                 preds: dict, settled: int, *, complete=True, version=None):
+        # the dictionaries are owned by the result from now on
+        self._source = source
+        self._distances = distances
+        self._preds = preds
+        self._settled = settled
+        self._complete = complete
+        self._version = version
+
+    @property
+    def source(self) -> Node:
+        """
+        This property returns the node the search started from.
+        """
+        return self._source
+
+    @property
+    def distances(self):
+        """
+        This property returns the read-only {node: distance} mapping of the reached nodes.
+        """
+        return MappingProxyType(self._distances)
+
+    @property
+    def preds(self):
+        """
+        This property returns the read-only {node: connection} predecessors mapping.
+        """
+        return MappingProxyType(self._preds)
+
+    @property
+    def settled(self) -> int:
+        """
+        This property returns the number of nodes the search settled.
+        """
+        return self._settled
+
+    @property
+    def complete(self) -> bool:
+        """
+        This property returns whether the search covered everything reachable (and was \
+            not stopped at its targets).
+        """
+        return self._complete
+
+    @property
+    def version(self):
+        """
+        This property returns the graph version the search ran on (None if unknown).
+        """
+        return self._version
+
+    def distance(self, node: Node):
+        """
+        This method returns the distance of a node (math.inf if it was not reached).
+        """
+        return self._distances.get(node, math.inf)
+
+    def path(self, node: Node) -> list[Connection]:
+        """
+        This method returns the path to a node ordered like the result of find_path \
+            (None if it was not reached).
+        """
+        return path_from_preds(self._preds, self._source, node)
+
+    def __len__(self):
+        return len(self._distances)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self._distances) + \
+            sys.getsizeof(self._preds)
+
+
+class Route(tuple):
+    """
+    Immutable result of a single-pair shortest-path query.
+
+    It unpacks as the (distance, path) pair the single-pair engines always returned, \
+        path being ordered like the result of find_path (None when the destination is \
+        unreachable), and also tells how many nodes the query settled (0 when it was \
+        answered without searching).
+    """
+    def __new__(cls, distance, path, settled: int):
+        route = super().__new__(cls, (distance, path))
+        route._settled = settled
+        return route
+
+    @property
+    def distance(self):
+        """
+        This property returns the distance of the route (math.inf if unreachable).
+        """
+        return self[0]
+
+    @property
+    def path(self) -> list[Connection]:
+        """
+        This property returns the connections of the route (None if unreachable).
+        """
+        return self[1]
+
+    @property
+    def settled(self) -> int:
+        """
+        This property returns the number of nodes the query settled.
+        """
+        return self._settled
 
 
-def dijkstra(graph: Graph, start_node: Node):
+def search(graph: Graph, start_node: Node, targets=None) -> ShortestPaths:
+    """
+    This function runs the dijkstra algorithm from start_node without touching the \
+        graph and returns its result.
+
+    The frontier is kept in a priority queue with lazy deletion: an improved distance \
+        pushes a new entry and outdated entries are skipped when popped. It is a binary \
+        heap, so a run costs O((V + E) log V), unless every weight is a non-negative \
+        integer, in which case a bucket queue or a radix heap is used instead. Should \
+        one of them be handed a distance it can not hold (a weight changed without \
+        Graph.set_weight), its entries are moved to a binary heap.
+
+    When targets are given, the search stops as soon as all of them are settled; \
+        the distances of the nodes left in the frontier are then only upper bounds.
+    """
+    distances = {start_node: 0}
+    preds = {}
+    settled = set()
+    remaining = None if targets is None else set(targets)
+    queue = make_queue(graph)
+    queue.push(0, start_node)
+    complete = True
+
+    while queue:
+        distance, min_d_node = queue.pop()
+        if min_d_node in settled or distance > distances[min_d_node]:
+            continue
+        settled.add(min_d_node)
+        if remaining is not None:
+            remaining.discard(min_d_node)
+            if not remaining:
+                complete = not queue
+                break
+
+        for node_x, connection in min_d_node.neighbors:
+            if node_x in settled:
+                continue
+            new_distance = distance + connection.weight
+            if new_distance < distances.get(node_x, math.inf):
+                distances[node_x] = new_distance
+                preds[node_x] = connection
+                try:
+                    queue.push(new_distance, node_x)
+                except ValueError:
+                    queue = BinaryHeap(queue.entries())
+                    queue.push(new_distance, node_x)
+
+    return ShortestPaths(start_node, distances, preds, len(settled), complete=complete,
+                         version=graph.version)
+
+
+def load_result(graph: Graph, result: ShortestPaths):
+    """
+    This function copies a search result into graph.distances and graph.preds, which \
+        are kept for compatibility, and makes it the tree repaired after edits when it \
+        is complete.
+    """
+    init(graph, result.source)
+    graph.distances.update(result.distances)
+    graph.preds.update(result.preds)
+    if result.complete:
+        graph.source = result.source
+
+
+def dijkstra(graph: Graph, start_node: Node, targets=None) -> ShortestPaths:
     """
     This method runs the dijkstra algorithm with the start node as the given node \
-        and updates the distances array accordingly
+        and updates the distances array accordingly. The predecessors map records, \
+        for every reached node, the connection it was last relaxed through.
+
+    See search for the details; the result is also returned. graph.source is only \
+        set when the whole tree has been computed.
     """
-    init(graph, start_node)
-    queue = graph.nodes.copy()
+    result = search(graph, start_node, targets)
+    load_result(graph, result)
+    return result
+
 
-    while len(queue) != 0:
-        min_d_node = search_min(graph, queue)
-        update_distances(graph, min_d_node)
-        queue.remove(min_d_node)
+# largest integer weight for which the bucket queue is preferred to the radix heap
+DIAL_MAX_WEIGHT = 255
 
 
-def find_path(graph: Graph, start_node: Node, dest_node: Node, ret_list=[]) -> list[Connection]:
+class BinaryHeap:
+    """
+    Binary heap of (distance, node) entries
+    """
+    def __init__(self, entries=()):
+        self._heap = [(distance, node.node_id, node) for distance, node in entries]
+        heapq.heapify(self._heap)
+
+    def push(self, distance, node: Node):
+        """
+        This method adds a node with the given distance.
+        """
+        # the node id breaks ties so that nodes themselves are never compared
+        heapq.heappush(self._heap, (distance, node.node_id, node))
+
+    def pop(self) -> tuple:
+        """
+        This method removes and returns the (distance, node) entry of minimal distance.
+        """
+        distance, _, node = heapq.heappop(self._heap)
+        return distance, node
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class BucketQueue:
+    """
+    Dial's bucket queue of (distance, node) entries for integer weights up to max_weight.
+
+    As the popped distances never decrease and all the queued distances are within \
+        max_weight of the last popped one, max_weight + 1 circular buckets are enough \
+        and each of them only ever holds a single distance value.
+    """
+    def __init__(self, max_weight: int):
+        self._buckets = [[] for _ in range(max_weight + 1)]
+        self._current = 0
+        self._size = 0
+
+    def push(self, distance: int, node: Node):
+        """
+        This method adds a node with the given distance, raising a ValueError if the \
+            distance is not an integer within max_weight above the last popped one.
+        """
+        if not isinstance(distance, int) or \
+                not 0 <= distance - self._current < len(self._buckets):
+            raise ValueError(f'distance {distance} out of the bucket queue range')
+        self._buckets[distance % len(self._buckets)].append(node)
+        self._size += 1
+
+    def pop(self) -> tuple:
+        """
+        This method removes and returns the (distance, node) entry of minimal distance.
+        """
+        buckets = self._buckets
+        while not buckets[self._current % len(buckets)]:
+            self._current += 1
+        self._size -= 1
+        return self._current, buckets[self._current % len(buckets)].pop()
+
+    def entries(self):
+        """
+        This method yields the (distance, node) entries left in the queue.
+        """
+        size = len(self._buckets)
+        for i, bucket in enumerate(self._buckets):
+            distance = self._current + (i - self._current) % size
+            for node in bucket:
+                yield distance, node
+
+    def __len__(self):
+        return self._size
+
+
+class RadixHeap:
+    """
+    Monotone radix heap of (distance, node) entries for non-negative integer distances.
+
+    An entry lives in the bucket given by the highest bit where its distance differs \
+        from the last popped one; refilling the first bucket only moves entries to \
+        lower buckets, so each entry is moved O(log C) times.
+    """
+    def __init__(self):
+        self._buckets = [[] for _ in range(65)]
+        self._last = 0
+        self._size = 0
+
+    def push(self, distance: int, node: Node):
+        """
+        This method adds a node with the given distance, raising a ValueError if the \
+            distance is not a 64 bits integer at least equal to the last popped one.
+        """
+        if not isinstance(distance, int) or distance < self._last or distance >= 1 << 64:
+            raise ValueError(f'distance {distance} out of the radix heap range')
+        self._buckets[(distance ^ self._last).bit_length()].append((distance, node))
+        self._size += 1
+
+    def pop(self) -> tuple:
+        """
+        This method removes and returns the (distance, node) entry of minimal distance.
+        """
+        buckets = self._buckets
+        if not buckets[0]:
+            index = 1
+            while not buckets[index]:
+                index += 1
+            entries = buckets[index]
+            buckets[index] = []
+            self._last = min(entry[0] for entry in entries)
+            for entry in entries:
+                buckets[(entry[0] ^ self._last).bit_length()].append(entry)
+        self._size -= 1
+        return buckets[0].pop()
+
+    def entries(self):
+        """
+        This method yields the (distance, node) entries left in the heap.
+        """
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __len__(self):
+        return self._size
+
+
+def make_queue(graph: Graph):
+    """
+    This function returns the fastest priority queue for the weights of the graph
+    """
+    max_weight = graph.max_integer_weight()
+    if max_weight is None:
+        return BinaryHeap()
+    if max_weight <= DIAL_MAX_WEIGHT:
+        return BucketQueue(max_weight)
+    return RadixHeap()
+
+
+def find_path(graph: Graph, start_node: Node, dest_node: Node) -> list[Connection]:
     """
     This method find the best route (minimal distance path) between start_node and dest_node.
 
-    This method should ONLY be ran after the dijkstra algorithm is applied!
+    The connections are returned from dest_node back to start_node, an empty list \
+        means both nodes are the same and None means dest_node is unreachable.
+
+    This method should ONLY be ran after the dijkstra algorithm is applied, or on \
+        a graph whose shortest paths from start_node were precomputed!
     """
-    if start_node == dest_node:
+    # the component index is not consulted: the tree repaired after a removal already
+    # tells unreachable nodes apart, whereas the index would have to be rebuilt
+    route = precomputed_route(graph, start_node, dest_node)
+    if route is not None:
+        return route[1]
+    return path_from_preds(graph.preds, start_node, dest_node)
+
+
+def precomputed_route(graph: Graph, start_node: Node, dest_node: Node):
+    """
+    This function answers a single-pair query from the precomputed shortest paths of \
+        the graph (graph.precomputed) when they are up to date.
+
+    Any object with the covers(graph, source, paths), distance(source, dest) and \
+        route(source, dest) methods can be used, like storage.DistanceStore or \
+        preprocessing.ContractionHierarchy.
+        :return: (distance, path) ordered like the result of find_path, or None when \
+            nothing precomputed covers the query
+        :rtype: Route
+    """
+    precomputed = graph.precomputed
+    if precomputed is None or not precomputed.covers(graph, start_node, True):
         return None
+    return precomputed.route(start_node, dest_node)
+
 
-    pred_node = graph.preds[dest_node]
-    conn = None
-    for conn in graph.connections:
-        if pred_node in conn.nodes and dest_node in conn.nodes:
+def path_from_preds(preds: dict, start_node: Node, dest_node: Node) -> list[Connection]:
+    """
+    This function rebuilds the path from dest_node back to start_node out of a \
+        predecessors map (None when the map does not lead to start_node)
+    """
+    path = []
+    node = dest_node
+    while node is not start_node:
+        conn = preds.get(node)
+        if conn is None:
+            return None
+        path.append(conn)
+        node = conn.other_node(node)
+    return path
+
+
+def _walk_preds(preds: dict, node: Node, root: Node) -> list[Connection]:
+    """
+    This function follows the predecessor connections from node up to root
+    """
+    path = []
+    while node is not root:
+        conn = preds[node]
+        path.append(conn)
+        node = conn.other_node(node)
+    return path
+
+
+def bidirectional_dijkstra(_graph: Graph, start_node: Node,  # pylint: disable=too-many-locals
+                           dest_node: Node) -> Route:
+    """
+    This function runs two dijkstra searches at once, a forward one from start_node and \
+        a backward one from dest_node, and stops when their frontiers meet.
+
+    It does not touch graph.distances nor graph.preds; the graph argument is only \
+        there to share the signature of the other single-pair engines.
+        :return: (distance, path) where path is ordered like the result of find_path \
+            (None when dest_node is unreachable)
+        :rtype: Route
+    """
+    if start_node is dest_node:
+        return Route(0, [], 0)
+
+    distances = ({start_node: 0}, {dest_node: 0})
+    preds = ({}, {})
+    settled = (set(), set())
+    heaps = ([(0, start_node.node_id, start_node)], [(0, dest_node.node_id, dest_node)])
+    best = math.inf
+    meeting_node = None
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
             break
-    if conn is None:
-        raise Exception(f'Connection between {pred_node} and {dest_node} not found!')
+        # grow the side whose frontier is the closest to its root
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        distance, _, node = heapq.heappop(heaps[side])
+        if node in settled[side] or distance > distances[side][node]:
+            continue
+        settled[side].add(node)
+
+        own_distances, other_distances = distances[side], distances[1 - side]
+        for node_x, connection in node.neighbors:
+            new_distance = distance + connection.weight
+            if new_distance < own_distances.get(node_x, math.inf):
+                own_distances[node_x] = new_distance
+                preds[side][node_x] = connection
+                heapq.heappush(heaps[side], (new_distance, node_x.node_id, node_x))
+            if node_x in other_distances and \
+                    own_distances[node_x] + other_distances[node_x] < best:
+                best = own_distances[node_x] + other_distances[node_x]
+                meeting_node = node_x
+
+    if meeting_node is None:
+        return Route(math.inf, None, len(settled[0]) + len(settled[1]))
+    return Route(best, _walk_preds(preds[1], meeting_node, dest_node)[::-1] +
+                 _walk_preds(preds[0], meeting_node, start_node),
+                 len(settled[0]) + len(settled[1]))
+
+
+def euclidean_distance(node1: Node, node2: Node) -> float:
+    """
+    This function returns the straight-line distance between two nodes positions
+    """
+    return math.hypot(node1.pos[0] - node2.pos[0], node1.pos[1] - node2.pos[1])
+
+
+def heuristic_is_admissible(graph: Graph) -> bool:
+    """
+    This function checks that every weight is at least graph.euclidean_scale times \
+        the length of its connection.
+
+    The check is made per connection, which makes the scaled euclidean distance a \
+        consistent (hence admissible) heuristic for A*. Its answer is kept until the \
+        graph is edited, its nodes are moved or the scale changes.
+    """
+    scale = graph.euclidean_scale
+    if scale is None or scale < 0:
+        return False
+
+    def compute():
+        for connection in graph.connections:
+            length = euclidean_distance(connection.nodes[0], connection.nodes[1])
+            if connection.weight < scale * length - 1e-9:
+                return False
+        return True
+    return graph.memoize('heuristic_is_admissible',
+                         (graph.version, graph.layout_version, scale), compute)
+
+
+def a_star(graph: Graph, start_node: Node, dest_node: Node, heuristic=None) -> Route:
+    """
+    This function runs an A* search from start_node to dest_node.
+
+    The heuristic is a function of a node returning a lower bound of its distance to \
+        dest_node, by default the euclidean distance scaled by graph.euclidean_scale. \
+        It must be consistent for the result to be exact.
+        :return: (distance, path) where path is ordered like the result of find_path \
+            (None when dest_node is unreachable)
+        :rtype: Route
+    """
+    if heuristic is None:
+        scale = graph.euclidean_scale or 0
+        def heuristic(node):
+            return scale * euclidean_distance(node, dest_node)
+
+    distances = {start_node: 0}
+    preds = {}
+    settled = set()
+    heap = [(heuristic(start_node), start_node.node_id, start_node)]
+
+    while heap:
+        _, _, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node is dest_node:
+            return Route(distances[node], _walk_preds(preds, dest_node, start_node),
+                         len(settled))
+
+        distance = distances[node]
+        for node_x, connection in node.neighbors:
+            if node_x in settled:
+                continue
+            new_distance = distance + connection.weight
+            if new_distance < distances.get(node_x, math.inf):
+                distances[node_x] = new_distance
+                preds[node_x] = connection
+                heapq.heappush(
+                    heap, (new_distance + heuristic(node_x), node_x.node_id, node_x))
+
+    return Route(math.inf, None, len(settled))
+
+
+def shortest_path(graph: Graph, start_node: Node, dest_node: Node,
+                  cache: 'ShortestPathCache' = None) -> Route:
+    """
+    This function answers a single-pair query with the fastest available engine: \
+        A* when the euclidean heuristic is admissible for the current weights and \
+        the bidirectional dijkstra otherwise.
+
+    When a cache is given, the whole shortest-path tree of start_node is computed \
+        (or reused if the graph did not change since) and the path is read from it. \
+        Precomputed paths of the graph (graph.precomputed) are used first, and nodes \
+        in different components are answered without any search.
+        :return: (distance, path) where path is ordered like the result of find_path \
+            (None when dest_node is unreachable)
+        :rtype: Route
+    """
+    if not graph.connected(start_node, dest_node):
+        return Route(math.inf, None, 0)
+    route = precomputed_route(graph, start_node, dest_node)
+    if route is not None:
+        return route
+    if cache is not None:
+        settled = 0
+        result = cache.get(start_node, graph.version)
+        if result is None:
+            result = search(graph, start_node)
+            cache.put(start_node, graph.version, result)
+            settled = result.settled
+        return Route(result.distance(dest_node), result.path(dest_node), settled)
+    if heuristic_is_admissible(graph):
+        return a_star(graph, start_node, dest_node)
+    return bidirectional_dijkstra(graph, start_node, dest_node)
+
+
+class ShortestPathCache:
+    """
+    Least recently used cache of shortest-path trees keyed on (source, graph version).
+
+    A tree is the ShortestPaths result of a complete search. The cache holds at most \
+        max_entries trees and roughly max_bytes of them.
+    """
+    def __init__(self, max_entries=16, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._trees = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+
+    @staticmethod
+    def tree_size(tree) -> int:
+        """
+        This method estimates the memory used by a shortest-path tree in bytes.
+        """
+        # the dictionaries plus roughly one float object per distance
+        return sys.getsizeof(tree) + 24 * len(tree)
+
+    def get(self, source, version):
+        """
+        This method returns the cached tree of source for the given graph version \
+            (None if it is not cached).
+        """
+        key = (source, version)
+        tree = self._trees.get(key)
+        if tree is not None:
+            self._trees.move_to_end(key)
+        return tree
+
+    def put(self, source, version, tree):
+        """
+        This method stores the tree of source for the given graph version, dropping \
+            the trees of older versions and the least recently used ones when full.
+        """
+        for key in [key for key in self._trees if key[1] != version or key[0] is source]:
+            self._discard(key)
+
+        size = self.tree_size(tree)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        self._trees[(source, version)] = tree
+        self._sizes[(source, version)] = size
+        self._bytes += size
+        while len(self._trees) > self.max_entries or self._bytes > self.max_bytes:
+            self._discard(next(iter(self._trees)))
+
+    def clear(self):
+        """
+        This method empties the cache.
+        """
+        self._trees.clear()
+        self._sizes.clear()
+        self._bytes = 0
+
+    def _discard(self, key):
+        del self._trees[key]
+        self._bytes -= self._sizes.pop(key)
+
+    def __len__(self):
+        return len(self._trees)
+
+
+def _propagate(graph: Graph, heap: list):
+    """
+    This function settles the nodes of the heap dijkstra-style, improving graph.distances \
+        and graph.preds wherever a shorter distance is found
+    """
+    distances = graph.distances
+    while heap:
+        distance, _, node = heapq.heappop(heap)
+        if distance > distances.get(node, math.inf):
+            continue
+        for node_x, connection in node.neighbors:
+            new_distance = distance + connection.weight
+            if new_distance < distances.get(node_x, math.inf):
+                distances[node_x] = new_distance
+                graph.preds[node_x] = connection
+                heapq.heappush(heap, (new_distance, node_x.node_id, node_x))
+
+
+def repair_decrease(graph: Graph, connection: Connection):
+    """
+    This function repairs the shortest-path tree of graph.source after a connection was \
+        added or had its weight decreased. Only the nodes whose distance improves are \
+        visited.
+    """
+    if graph.source is None:
+        return
+    distances = graph.distances
+    heap = []
+    for node, node_x in (connection.nodes, connection.nodes[::-1]):
+        new_distance = distances.get(node, math.inf) + connection.weight
+        if new_distance < distances.get(node_x, math.inf):
+            distances[node_x] = new_distance
+            graph.preds[node_x] = connection
+            heapq.heappush(heap, (new_distance, node_x.node_id, node_x))
+    _propagate(graph, heap)
+
+
+def _recompute_subtrees(graph: Graph, roots: list):
+    """
+    This function recomputes the distances of the nodes hanging below the given roots \
+        in the shortest-path tree, seeding them from the rest of the tree
+    """
+    distances, preds = graph.distances, graph.preds
+    affected = set()
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        if node in affected:
+            continue
+        affected.add(node)
+        for node_x, connection in node.neighbors:
+            if preds.get(node_x) is connection and node_x is not graph.source:
+                stack.append(node_x)
+
+    for node in affected:
+        distances[node] = math.inf
+        preds.pop(node, None)
+
+    heap = []
+    for node in affected:
+        for node_x, connection in node.neighbors:
+            if node_x in affected:
+                continue
+            new_distance = distances.get(node_x, math.inf) + connection.weight
+            if new_distance < distances[node]:
+                distances[node] = new_distance
+                preds[node] = connection
+        if distances[node] < math.inf:
+            heapq.heappush(heap, (distances[node], node.node_id, node))
+    _propagate(graph, heap)
+
+
+def repair_increase(graph: Graph, connection: Connection):
+    """
+    This function repairs the shortest-path tree of graph.source after a connection was \
+        removed or had its weight increased. Nothing is done unless the connection is \
+        part of the tree, otherwise only the subtree below it is recomputed.
+    """
+    if graph.source is None:
+        return
+    roots = [node for node in connection.nodes if graph.preds.get(node) is connection]
+    _recompute_subtrees(graph, roots)
+
+
+def repair_removed_node(graph: Graph, node: Node, connections: list):
+    """
+    This function repairs the shortest-path tree of graph.source after a node and its \
+        connections were removed from the graph.
+    """
+    if graph.source is None:
+        return
+    if node is graph.source:
+        graph.source = None
+        return
+    roots = []
+    for connection in connections:
+        node_x = connection.other_node(node)
+        if graph.preds.get(node_x) is connection:
+            roots.append(node_x)
+    graph.distances.pop(node, None)
+    graph.preds.pop(node, None)
+    _recompute_subtrees(graph, roots)
+
+
+def repair_weight_change(graph: Graph, connection: Connection, old_weight):
+    """
+    This function repairs the shortest-path tree of graph.source after the weight of a \
+        connection changed from old_weight to its current value.
+    """
+    if connection.weight < old_weight:
+        repair_decrease(graph, connection)
+    elif connection.weight > old_weight:
+        repair_increase(graph, connection)
+
+
+# number of nodes settled between two progress reports of dijkstra_snapshot
+PROGRESS_STEP = 1024
+
+
+# the arrays are bound to locals for the speed of the inner loop
+def dijkstra_snapshot(snapshot: GraphSnapshot, source: int,  # pylint: disable=too-many-locals
+                      targets=None, progress=None, cancel=None) -> tuple:
+    """
+    This function runs the dijkstra algorithm on a graph snapshot, from the node at \
+        the given index.
+
+    When targets (node indexes) are given, the search stops once all of them are settled.
+        Every PROGRESS_STEP settled nodes, progress (if given) is called with the \
+        settled fraction of the nodes and the search gives up if the cancel event \
+        (if given) is set.
+        :return: (distances, pred_edges) arrays indexed like the snapshot nodes, \
+            pred_edges holding the connection index each node was reached through \
+            (-1 for the source and the unreached nodes), or None when cancelled
+        :rtype: tuple
+    """
+    offsets, node_targets, weights, edge_ids = \
+        snapshot.offsets, snapshot.targets, snapshot.weights, snapshot.edge_ids
+    distances = array('d', [math.inf]) * len(snapshot)
+    pred_edges = array('q', [-1]) * len(snapshot)
+    settled = bytearray(len(snapshot))
+    remaining = None if targets is None else set(targets)
+
+    distances[source] = 0
+    heap = [(0.0, source)]
+    count = 0
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if settled[node]:
+            continue
+        settled[node] = 1
+        count += 1
+        if count % PROGRESS_STEP == 0:
+            if cancel is not None and cancel.is_set():
+                return None
+            if progress is not None:
+                progress(count / len(snapshot))
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+
+        for slot in range(offsets[node], offsets[node + 1]):
+            node_x = node_targets[slot]
+            new_distance = distance + weights[slot]
+            if new_distance < distances[node_x]:
+                distances[node_x] = new_distance
+                pred_edges[node_x] = edge_ids[slot]
+                heapq.heappush(heap, (new_distance, node_x))
+    return distances, pred_edges
+
+
+def snapshot_path(snapshot: GraphSnapshot, pred_edges, start_node: Node,
+                  dest_node: Node, row=0) -> list[Connection]:
+    """
+    This function rebuilds, ordered like the result of find_path, the path to dest_node \
+        out of the pred_edges computed by dijkstra_snapshot from start_node \
+        (None when dest_node was not reached). The pred_edges may be read from a \
+        matrix, at the given row offset.
+    """
+    path = []
+    node = dest_node
+    while node is not start_node:
+        edge_id = pred_edges[row + snapshot.index_of(node)]
+        if edge_id < 0:
+            return None
+        conn = snapshot.connections[edge_id]
+        path.append(conn)
+        node = conn.other_node(node)
+    return path
+
+
+def tree_from_snapshot(snapshot: GraphSnapshot, source: int, distances,
+                       pred_edges) -> ShortestPaths:
+    """
+    This function converts the arrays computed by dijkstra_snapshot from the node at \
+        the source index into a ShortestPaths result keyed by nodes.
+    """
+    nodes, connections = snapshot.nodes, snapshot.connections
+    reached = [i for i, distance in enumerate(distances) if distance < math.inf]
+    return ShortestPaths(nodes[source], {nodes[i]: distances[i] for i in reached},
+                         {nodes[i]: connections[pred_edges[i]] for i in reached
+                          if pred_edges[i] >= 0}, len(reached), version=snapshot.version)
+
+
+class ShortestPathJob(threading.Thread):
+    """
+    Worker thread computing the shortest-path tree of a node on a graph snapshot.
+
+    The snapshot is immutable, so the graph can keep being edited meanwhile; the \
+        owner checks snapshot.is_stale(graph) before using the result. The progress \
+        (settled fraction of the nodes) and the result are read from other threads.
+    """
+    def __init__(self, snapshot: GraphSnapshot, source: int, targets=None):
+        super().__init__(daemon=True)
+        self.snapshot = snapshot
+        self.source = source
+        self.targets = targets
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+
+    def run(self):
+        try:
+            self.result = dijkstra_snapshot(self.snapshot, self.source, self.targets,
+                                            self._report, self._cancel)
+            self.progress = 1.0
+        except Exception as exc:  # pylint: disable=broad-except
+            self.error = exc
+
+    def _report(self, progress):
+        self.progress = progress
 
-    ret_list.append(conn)
-    find_path(graph, start_node, pred_node, ret_list)
+    def cancel(self):
+        """
+        This method asks the computation to stop as soon as possible.
+        """
+        self._cancel.set()
 
-    return ret_list
+    @property
+    def cancelled(self):
+        """
+        This property returns whether the job was asked to stop.
+        """
+        return self._cancel.is_set()
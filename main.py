@@ -1,12 +1,15 @@
 """
 The main module
 """
+import argparse
 import os
 
 import pygame
-from pygame.locals import QUIT, MOUSEMOTION, MOUSEBUTTONUP, MOUSEBUTTONDOWN
+from pygame.locals import (QUIT, MOUSEMOTION, MOUSEBUTTONUP, MOUSEBUTTONDOWN, MOUSEWHEEL,
+                           NOEVENT, RESIZABLE, VIDEORESIZE)
 
-from models import Graph
+from models import CANVAS_SIZE, Graph
+from renderer import Renderer
 from views import ToolBar
 
 RUNNING = True
@@ -20,21 +23,76 @@ def quit_callback():
     global RUNNING
     RUNNING = False
 
-def on_node_hover(graph):
+def on_node_hover(graph, pos, hovered):
     """
-    This method marks the nodes that are hovered onto by the mouse.
+    This method marks the nodes that are hovered onto by the mouse at the given position.
+
+    Only the nodes near the mouse are looked up, and only the nodes entering or leaving \
+        the given set of hovered nodes are updated. The new set is returned.
     """
-    for node in graph.nodes:
+    now_hovered = set(graph.grid.nodes_at(pos))
+    for node in hovered - now_hovered:
         node.hovered = False
-        if node.pos[0] <= pygame.mouse.get_pos()[0]+node.radius and \
-            node.pos[0] >= pygame.mouse.get_pos()[0]-node.radius and \
-                node.pos[1] <= pygame.mouse.get_pos()[1]+node.radius and \
-                    node.pos[1] >= pygame.mouse.get_pos()[1]-node.radius:
-            node.hovered = True
+    for node in now_hovered - hovered:
+        node.hovered = True
+    return now_hovered
+
+PAN_BUTTON = 2
+ZOOM_STEP = 1.1
+# frames per second while the user interacts with the window
+FRAMERATE = 30
+# longest wait for a pygame event when idle, so that tkinter keeps being serviced
+IDLE_TIMEOUT = 50  # ms
+# longest time between two clicks of a double click
+DOUBLE_CLICK_DURATION = 150  # ms
+
+
+def next_events(idle, timeout):
+    """
+    This method returns the pending pygame events. When idle, it first blocks until \
+        an event comes or the timeout (in ms) expires.
+    """
+    if idle:
+        event = pygame.event.wait(timeout)
+        if event.type == NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    return pygame.event.get()
+
+
+def to_world_event(event, camera):
+    """
+    This method returns a copy of a mouse event with its position in world coordinates.
+    """
+    return pygame.event.Event(event.type, dict(event.dict, pos=camera.to_world(event.pos)))
 
-def main():
+
+def handle_view_event(event, renderer):
+    """
+    This method handles the events moving the view (middle button drag to pan, wheel \
+        to zoom, window resizing) and returns whether the event was consumed.
+    """
+    camera = renderer.camera
+    if event.type == MOUSEWHEEL:
+        camera.zoom_at(pygame.mouse.get_pos(), ZOOM_STEP ** event.y)
+    elif event.type == VIDEORESIZE:
+        renderer.screen = pygame.display.get_surface()
+    elif event.type == MOUSEMOTION and event.buttons[PAN_BUTTON - 1]:
+        camera.pan(event.rel)
+    elif event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+        # the pan button and the wheel (buttons 4 and 5) are not meant for the tools
+        return event.button == PAN_BUTTON or event.button > 3
+    else:
+        return False
+    return True
+
+
+def main(framerate=FRAMERATE, idle_timeout=IDLE_TIMEOUT):
     """
     This is the main method of the program
+
+    The window is only drawn again when something changed. While nothing happens, \
+        the loop sleeps in pygame.event.wait instead of ticking at the frame rate.
     """
     global RUNNING
 
@@ -56,29 +114,35 @@ def main():
     clock = pygame.time.Clock()
 
     # initialize variables
-    font = pygame.font.SysFont(None, 25)
-    framerate = 30
-    double_click_duration = 150  # ms
+    idle = False
     last_click = 0
+    hovered = set()
 
     # sets the window title
     screen = pygame.display.set_caption('Dijkstra 2019-2020')
 
     # sets the window size
-    screen = pygame.display.set_mode((500, 500))
+    screen = pygame.display.set_mode(CANVAS_SIZE, RESIZABLE)
+    renderer = Renderer(screen, pygame.font.SysFont(None, 25), BACKGROUND_COLOR)
 
     while RUNNING:
-        for event in pygame.event.get():
+        events = next_events(idle, idle_timeout)
+        for event in events:
+            if handle_view_event(event, renderer):
+                continue
+            if event.type in (MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+                event = to_world_event(event, renderer.camera)
+
             if event.type == QUIT:
                 RUNNING = False
             elif event.type == MOUSEMOTION:
                 toolbar.tool.handle_mouse_move(event)
 
-                on_node_hover(graph)
+                hovered = on_node_hover(graph, event.pos, hovered)
             elif event.type == MOUSEBUTTONDOWN:
                 now = pygame.time.get_ticks()
-                double_click = (now - last_click) <= double_click_duration
-                last_click = pygame.time.get_ticks()
+                double_click = (now - last_click) <= DOUBLE_CLICK_DURATION
+                last_click = now
 
                 toolbar.tool.handle_mouse_down(event, double_click)
 
@@ -86,26 +150,21 @@ def main():
                 toolbar.tool.handle_mouse_up(event)
 
         # Rendering
-        clock.tick(framerate)
-        screen.fill(BACKGROUND_COLOR)
-
-        toolbar.tool.render_preview(screen)
-
-        for connection in graph.connections:
-            connection.render(screen, font)
-
-        for node in graph.nodes:
-            node.render(screen, font)
-
-        pygame.display.update()
+        dirty_rects = renderer.render(graph, toolbar.tool, hovered)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
 
         toolbar.update()
-        # try:
-        # except Exception as exc:
-        #     print("ToolBar error")
+
+        idle = not events and not dirty_rects
+        if not idle:
+            clock.tick(framerate)
 
     toolbar.destroy()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Dijkstra algorithm GUI')
+    parser.add_argument('--fps', type=int, default=FRAMERATE,
+                        help='frame rate while the window is in use')
+    main(parser.parse_args().fps)
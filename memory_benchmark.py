@@ -0,0 +1,107 @@
+"""
+Memory benchmark
+
+This script measures the memory used per node and per connection by a random graph, \
+    with the current Node and Connection classes and with their former layout
+"""
+import argparse
+import random
+import tracemalloc
+
+from models import Connection, Graph, Node
+
+
+class DictNode:
+    """
+    Node laid out like before the slots: every attribute in a per-instance __dict__ \
+        and the neighbors indexed both by connection and by neighbor.
+    """
+    node_ids = 0
+
+    def __init__(self, text='', pos=(0, 0)):
+        self.node_id = DictNode.node_ids
+        self.pos = pos
+        self.radius = 20
+        self.color = (255, 0, 0)
+        self.text = text
+        self.hovered = False
+        self.selected = False
+        self._incident = {}
+        self._links = {}
+        DictNode.node_ids += 1
+
+    def add_neighbor(self, node):
+        """
+        This method adds the (node, connection) pair to the node's neighbors.
+        """
+        self._incident[node[1]] = node
+        self._links[node[0]] = node[1]
+
+
+class DictConnection:  # pylint: disable=too-few-public-methods
+    """
+    Connection laid out like before the slots, see DictNode.
+    """
+    def __init__(self, nodes=(None, None), weight=0, color=(0, 0, 0)):
+        self.nodes = nodes
+        self.weight = weight
+        self.color = color
+        self._highlighted = False
+        nodes[0].add_neighbor((nodes[1], self))
+        nodes[1].add_neighbor((nodes[0], self))
+
+
+def random_graph_data(node_count, connection_count, seed=0):
+    """
+    This method returns the node positions and the (first, second, weight) connections \
+        of a random graph.
+    """
+    rnd = random.Random(seed)
+    positions = [(rnd.randint(0, 5000), rnd.randint(0, 5000)) for _ in range(node_count)]
+    connections = [(*rnd.sample(range(node_count), 2), rnd.randint(0, 100))
+                   for _ in range(connection_count)]
+    return positions, connections
+
+
+def measure(positions, connections, node_class=Node, connection_class=Connection):
+    """
+    This method builds a graph out of the given nodes and connections with the given \
+        classes and returns the (bytes per node, bytes per connection) it allocated, \
+        graph containers and indexes included (node positions excepted).
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    graph = Graph()
+    for i, pos in enumerate(positions):
+        graph.add_node(node_class(str(i), pos))
+    after_nodes = tracemalloc.get_traced_memory()[0]
+    for first, second, weight in connections:
+        graph.add_connection(connection_class((graph.nodes[first], graph.nodes[second]),
+                                              weight))
+    after_connections = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return ((after_nodes - start) / max(len(positions), 1),
+            (after_connections - after_nodes) / max(len(connections), 1))
+
+
+def main():
+    """
+    This is the main method of the benchmark
+    """
+    parser = argparse.ArgumentParser(description='Graph memory benchmark')
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--connections', type=int, default=300000)
+    args = parser.parse_args()
+
+    positions, connections = random_graph_data(args.nodes, args.connections)
+    before = measure(positions, connections, DictNode, DictConnection)
+    after = measure(positions, connections)
+    print(f'{args.nodes} nodes, {args.connections} connections')
+    print(f'{"":22}{"before":>8}{"after":>9}')
+    print(f'bytes per node:       {before[0]:8.1f} {after[0]:8.1f}')
+    print(f'bytes per connection: {before[1]:8.1f} {after[1]:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
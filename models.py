@@ -2,17 +2,31 @@
 This is the Models module
 """
 
+from array import array
+from collections import OrderedDict
+from collections.abc import Collection, Sequence
+from itertools import chain, count
 from typing import Tuple
+import hashlib
 import random
 
 from pygame import draw
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def random_position() -> Tuple[int, int]:
+
+# default size of the drawing area (width, height)
+CANVAS_SIZE = (500, 500)
+
+
+def random_position(size=CANVAS_SIZE) -> Tuple[int, int]:
     """
-    This methods returns a random position (x, y)
+    This methods returns a random position (x, y) inside an area of the given size
     """
-    return (random.randint(25, 500-25), random.randint(25, 500-25))
+    return (random.randint(25, size[0]-25), random.randint(25, size[1]-25))
 
 
 def random_color() -> Tuple[int, int, int]:
@@ -23,32 +37,187 @@ def random_color() -> Tuple[int, int, int]:
     return (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
 
 
+class LabelCache:
+    """
+    Least recently used cache of rendered text surfaces keyed on (text, color, font).
+    """
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._labels = OrderedDict()
+
+    def get(self, font, text, color=(0, 0, 0)):
+        """
+        This method returns the surface of the given text, rendering it only when it is \
+            not cached yet.
+        """
+        key = (text, color, font)
+        label = self._labels.get(key)
+        if label is None:
+            label = font.render(text, 1, color)
+            self._labels[key] = label
+            if len(self._labels) > self.max_entries:
+                self._labels.popitem(last=False)
+        else:
+            self._labels.move_to_end(key)
+        return label
+
+    def evict(self, text):
+        """
+        This method drops the surfaces of a text that is no longer displayed.
+        """
+        for key in [key for key in self._labels if key[0] == text]:
+            del self._labels[key]
+
+    def clear(self):
+        """
+        This method empties the cache.
+        """
+        self._labels.clear()
+
+    def __len__(self):
+        return len(self._labels)
+
+
+LABELS = LabelCache()
+
+
+class Neighbors(Collection):
+    """
+    Live view of the (neighbor, connection) pairs of a node.
+
+    Like a dictionary view, it can be iterated any number of times and follows the \
+        changes of the node, which must not gain or lose connections while it is being \
+        iterated (iterate over list(node.neighbors) to do so).
+    """
+    __slots__ = ('_links', '_parallel')
+
+    def __init__(self, links: dict, parallel: dict):
+        self._links = links
+        self._parallel = parallel
+
+    def __iter__(self):
+        if not self._parallel:
+            return iter(self._links.items())
+        return chain(self._links.items(), ((neighbor, connection)
+                                           for neighbor, connections in self._parallel.items()
+                                           for connection in connections))
+
+    def __len__(self):
+        return len(self._links) + sum(map(len, self._parallel.values()))
+
+    def __contains__(self, pair):
+        neighbor, connection = pair
+        return self._links.get(neighbor) is connection or \
+            connection in self._parallel.get(neighbor, ())
+
+
+class Connections(Collection):
+    """
+    Live view of the connections of a node, see Neighbors. Membership tests take \
+        constant time.
+    """
+    __slots__ = ('_node', '_neighbors')
+
+    def __init__(self, node, neighbors: Neighbors):
+        self._node = node
+        self._neighbors = neighbors
+
+    def __iter__(self):
+        return (connection for _, connection in self._neighbors)
+
+    def __len__(self):
+        return len(self._neighbors)
+
+    def __contains__(self, connection):
+        return (connection.other_node(self._node), connection) in self._neighbors
+
+
 class Node:
     """
     Node class
+
+    Nodes have no __dict__: their attributes live in slots, the radius and the default \
+        color are shared at class level and the hovered / selected flags are packed in \
+        the bits of one integer.
+
+    A node keeps one connection per neighbor in a dictionary, which gives the \
+        neighbors, the connection to a neighbor and the removal of a connection in \
+        constant time. The rare parallel connections are kept aside.
     """
-    node_ids = 0
+    __slots__ = ('_id', 'pos', 'text', '_color', '_flags', '_links', '_parallel')
 
-    def __init__(self, text='', pos=(0, 0)):
-        self._id = Node.node_ids
+    node_ids = 0
+    # bumped by every add_neighbor / remove_neighbor, see ComponentIndex
+    link_edits = 0
+    last_link = None
+    radius = 20
+    DEFAULT_COLOR = (255, 0, 0)
+    HOVERED = 1
+    SELECTED = 2
+
+    def __init__(self, text='', pos=(0, 0), node_id=None):
+        if node_id is None:
+            node_id = Node.node_ids
+        self._id = node_id
         self.pos = pos
-        self.radius = 20
-        self.color = (255, 0, 0)
         self.text = text
-        self.hovered = False
-        self.selected = False
+        self._color = Node.DEFAULT_COLOR
+        self._flags = 0
+
+        # neighbor -> connection, in insertion order
+        self._links = {}
+        # neighbor -> the other connections to that neighbor
+        self._parallel = {}
+
+        # ids given explicitly (by a loaded graph) are never handed out again
+        Node.node_ids = max(Node.node_ids, node_id + 1)
+
+    @property
+    def color(self):
+        """
+        This property returns the (r, g, b) color of the node.
+        """
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = tuple(color)
+
+    @property
+    def hovered(self):
+        """
+        This property returns whether the mouse is over the node.
+        """
+        return bool(self._flags & Node.HOVERED)
+
+    @hovered.setter
+    def hovered(self, hovered):
+        self._flags = self._flags | Node.HOVERED if hovered else self._flags & ~Node.HOVERED
 
-        self._neighbors = []
+    @property
+    def selected(self):
+        """
+        This property returns whether the node is selected.
+        """
+        return bool(self._flags & Node.SELECTED)
 
-        Node.node_ids += 1
+    @selected.setter
+    def selected(self, selected):
+        self._flags = self._flags | Node.SELECTED if selected else self._flags & ~Node.SELECTED
 
-    def render(self, screen, font):
+    def render(self, screen, font, hovered=None, camera=None):
         """
-        This is the render method. It renders the Node object in the window.
+        This is the render method. It renders the Node object in the window and returns \
+            the area it covers. The hovered argument overrides the hovered property.
+
+        When a camera is given, the node is drawn where the camera sees it, and as a \
+            simple point when the camera is not in detailed mode.
         """
         (color_r, color_g, color_b) = self.color
+        if hovered is None:
+            hovered = self.hovered
 
-        if self.hovered:
+        if hovered:
             color_r = min(self.color[0]+50, 255)
             color_g = min(self.color[1]+50, 255)
             color_b = min(self.color[2]+50, 255)
@@ -57,29 +226,64 @@ class Node:
             color_g = max(self.color[1]-50, 0)
             color_b = max(self.color[2]-50, 0)
 
+        pos, radius = self.pos, self.radius
+        if camera is not None:
+            pos, radius = camera.to_screen(pos), max(1, round(radius * camera.zoom))
+            if not camera.detailed:
+                return draw.circle(screen, (color_r, color_g, color_b), pos, min(radius, 2))
+
         # drawing the circle
-        draw.circle(screen, (color_r, color_g, color_b), self.pos, self.radius)
+        area = draw.circle(screen, (color_r, color_g, color_b), pos, radius)
         # drawing the outline
         width = 1
-        if self.hovered or self.selected:
+        if hovered or self.selected:
             width = 2
-        draw.circle(screen, (0, 0, 0), self.pos, self.radius, width)
+        draw.circle(screen, (0, 0, 0), pos, radius, width)
 
         # drawing the text
-        label = font.render(self.text, 1, (0, 0, 0))
-        screen.blit(label, (self.pos[0]-6, self.pos[1]-5))
+        label = LABELS.get(font, self.text)
+        return area.union(screen.blit(label, (pos[0]-6, pos[1]-5)))
 
     def add_neighbor(self, node):
         """
-        This method adds the node object to a given node's neighbors.
-        """
-        self._neighbors.append(node)
-
-    def remove_neighbor(self, node):
-        """
-        This method removes the given node object from the node's neighbors.
-        """
-        self._neighbors = [neighbor for neighbor in self._neighbors if neighbor[0] != node]
+        This method adds the (node, connection) pair to a given node's neighbors.
+        """
+        neighbor, connection = node
+        Node.link_edits += 1
+        Node.last_link = connection
+        if neighbor not in self._links:
+            self._links[neighbor] = connection
+        elif node not in self.neighbors:
+            self._parallel.setdefault(neighbor, []).append(connection)
+
+    def remove_neighbor(self, node, connection=None):
+        """
+        This method removes the given node object from the node's neighbors. When a \
+            connection is given, only that link to the node is removed, in constant time \
+            (plus the number of parallel connections to the node).
+        """
+        Node.link_edits += 1
+        if connection is None:
+            self._links.pop(node, None)
+            self._parallel.pop(node, None)
+            return
+        others = self._parallel.get(node, [])
+        if self._links.get(node) is connection:
+            if others:
+                self._links[node] = others.pop(0)
+            else:
+                del self._links[node]
+        elif connection in others:
+            others.remove(connection)
+        if not others:
+            self._parallel.pop(node, None)
+
+    def connection_to(self, node):
+        """
+        This method returns the connection linking the current node to the given node \
+            (None if they are not connected).
+        """
+        return self._links.get(node)
 
     @property
     def node_id(self):
@@ -91,9 +295,17 @@ class Node:
     @property
     def neighbors(self):
         """
-        This property returns the neighbors of the current node.
+        This property returns a view of the (neighbor, connection) pairs of the \
+            current node.
+        """
+        return Neighbors(self._links, self._parallel)
+
+    @property
+    def connections(self):
+        """
+        This property returns a view of the connections of the current node.
         """
-        return self._neighbors
+        return Connections(self, self.neighbors)
 
     @property
     def hex_color(self):
@@ -112,58 +324,84 @@ class Node:
 class Connection:
     """
     Connection class
+
+    Like nodes, connections keep their attributes in slots, with the highlight flag \
+        packed in an integer.
     """
+    __slots__ = ('nodes', 'weight', 'color', '_flags')
+
     HIGHLIGHT_COLOR = (255, 0, 0)
-    def __init__(self, nodes=(None, None), weight=0, color=(0, 0, 0)):
-        self.nodes = nodes
+    DEFAULT_COLOR = (0, 0, 0)
+    HIGHLIGHTED = 1
+
+    def __init__(self, nodes=(None, None), weight=0, color=DEFAULT_COLOR):
+        self.nodes = tuple(nodes)
         self.nodes[0].add_neighbor((self.nodes[1], self))
         self.nodes[1].add_neighbor((self.nodes[0], self))
 
         self.weight = weight
         self.color = color
-        self._highlighted = False
+        self._flags = 0
+
+    def other_node(self, node):
+        """
+        This method returns the end of the connection opposite to the given node.
+        """
+        if self.nodes[0] is node:
+            return self.nodes[1]
+        return self.nodes[0]
 
     @property
     def is_highlighted(self):
         """
         This property returns whether the highlighted property is enabled or disabled
         """
-        return self._highlighted
+        return bool(self._flags & Connection.HIGHLIGHTED)
 
     def disable_highlight(self):
         """
         This methods disables the highlight of the connection (line).
         """
-        self._highlighted = False
+        self._flags &= ~Connection.HIGHLIGHTED
 
     def enable_highlight(self):
         """
         This method enables the highlight of the connection (line).
         """
-        self._highlighted = True
+        self._flags |= Connection.HIGHLIGHTED
 
-    def render(self, screen, font):
+    def render(self, screen, font, camera=None):
         """
-        This method renders the connect object (line) in the window.
+        This method renders the connect object (line) in the window and returns the \
+            area it covers.
+
+        When a camera is given, the line is drawn where the camera sees it, and thin \
+            and without its weight when the camera is not in detailed mode.
         """
         node_1_pos = self.nodes[0].pos
         node_2_pos = self.nodes[1].pos
+        if camera is not None:
+            node_1_pos, node_2_pos = camera.to_screen(node_1_pos), camera.to_screen(node_2_pos)
+            if not camera.detailed:
+                color = Connection.HIGHLIGHT_COLOR if self.is_highlighted else self.color
+                return draw.line(screen, color, node_1_pos, node_2_pos, 1)
 
         # drawing the highlight
-        if self._highlighted:
-            draw.line(screen, Connection.HIGHLIGHT_COLOR, node_1_pos, node_2_pos, 6)
-
-        # drawing the line
-        draw.line(screen, self.color, node_1_pos, node_2_pos, 2)
+        if self.is_highlighted:
+            area = draw.line(screen, Connection.HIGHLIGHT_COLOR, node_1_pos, node_2_pos, 6)
+            draw.line(screen, self.color, node_1_pos, node_2_pos, 2)
+        else:
+            # drawing the line
+            area = draw.line(screen, self.color, node_1_pos, node_2_pos, 2)
 
         # drawing the weight
-        label = font.render(str(self.weight), 1, (0, 0, 0))
+        label = LABELS.get(font, str(self.weight))
 
         # calculating the median position of the two nodes
         pos_x = (node_1_pos[0] + node_2_pos[0]) / 2
         pos_y = (node_1_pos[1] + node_2_pos[1]) / 2
 
-        screen.blit(label, (pos_x, pos_y))
+        return area.union(screen.blit(label, (pos_x, pos_y)))
 
     def __str__(self):
         return f'{self.nodes[0]} -> {self.nodes[1]} = {self.weight}'
@@ -172,17 +410,400 @@ class Connection:
         return str(self)
 
 
-class Graph:
+class SpatialGrid:
+    """
+    Uniform grid of square cells indexing the nodes by position.
+
+    A node is stored in the cell of its center; a lookup visits the cells within the \
+        largest node radius of the searched area.
+
+    Connections are indexed by their bounding box on a stack of grids whose cells double in size \
+        from one level to the next: a connection lives on the first level whose cells are at \
+        least as large as it is, in the (at most 4) cells its bounding box overlaps. Those cells \
+        are worked out from the positions of its nodes, so a connection must be removed before \
+        one of its nodes moves and inserted again afterwards (see Graph.move_node).
+    """
+    def __init__(self, cell_size=40):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._cell_of = {}
+        self._max_radius = 0
+        # level -> {cell: connections}
+        self._levels = {}
+
+    def _cell(self, pos, size=None):
+        size = size or self.cell_size
+        return (int(pos[0] // size), int(pos[1] // size))
+
+    def insert(self, node):
+        """
+        This method adds a node to the grid.
+        """
+        cell = self._cell(node.pos)
+        self._cells.setdefault(cell, set()).add(node)
+        self._cell_of[node] = cell
+        self._max_radius = max(self._max_radius, node.radius)
+
+    def remove(self, node):
+        """
+        This method removes a node from the grid.
+        """
+        cell = self._cell_of.pop(node, None)
+        if cell is not None:
+            self._cells[cell].discard(node)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def move(self, node):
+        """
+        This method updates the cell of a node after its position changed.
+        """
+        if self._cell_of.get(node) != self._cell(node.pos):
+            self.remove(node)
+            self.insert(node)
+
+    def _connection_cells(self, connection) -> tuple:
+        # returns the level of a connection and the cells it is stored in
+        (x_1, y_1), (x_2, y_2) = connection.nodes[0].pos, connection.nodes[1].pos
+        span = max(abs(x_1 - x_2), abs(y_1 - y_2))
+        level, size = 0, self.cell_size
+        while size < span:
+            level, size = level + 1, size * 2
+        first_x, last_x = int(min(x_1, x_2) // size), int(max(x_1, x_2) // size)
+        first_y, last_y = int(min(y_1, y_2) // size), int(max(y_1, y_2) // size)
+        if first_x == last_x and first_y == last_y:
+            return level, ((first_x, first_y),)
+        return level, [(x, y) for x in range(first_x, last_x + 1)
+                       for y in range(first_y, last_y + 1)]
+
+    def insert_connection(self, connection):
+        """
+        This method adds a connection to the grid.
+        """
+        level, cells = self._connection_cells(connection)
+        grid = self._levels.setdefault(level, {})
+        for cell in cells:
+            grid.setdefault(cell, set()).add(connection)
+
+    def remove_connection(self, connection):
+        """
+        This method removes a connection from the grid.
+        """
+        level, cells = self._connection_cells(connection)
+        grid = self._levels.get(level, {})
+        for cell in cells:
+            if cell in grid:
+                grid[cell].discard(connection)
+                if not grid[cell]:
+                    del grid[cell]
+
+    def connections_in_rect(self, left, top, right, bottom):
+        """
+        This method returns the connections whose bounding box may meet the given rectangle.
+        """
+        found = set()
+        for level, grid in self._levels.items():
+            size = self.cell_size << level
+            first_x, first_y = self._cell((left, top), size)
+            last_x, last_y = self._cell((right, bottom), size)
+            for cell in _cells_in_range(grid, first_x, first_y, last_x, last_y):
+                found.update(grid.get(cell, ()))
+        return found
+
+    def nodes_in_rect(self, left, top, right, bottom):
+        """
+        This method yields the nodes whose circle may intersect the given rectangle.
+        """
+        margin = self._max_radius
+        first_x, first_y = self._cell((left - margin, top - margin))
+        last_x, last_y = self._cell((right + margin, bottom + margin))
+        for cell in _cells_in_range(self._cells, first_x, first_y, last_x, last_y):
+            yield from self._cells.get(cell, ())
+
+    def nodes_at(self, pos):
+        """
+        This method returns the nodes whose bounding square contains the given position.
+        """
+        return [node for node in self.nodes_in_rect(pos[0], pos[1], pos[0], pos[1])
+                if abs(pos[0] - node.pos[0]) <= node.radius and
+                abs(pos[1] - node.pos[1]) <= node.radius]
+
+    def __contains__(self, node):
+        return node in self._cell_of
+
+    def __len__(self):
+        return len(self._cell_of)
+
+
+def _cells_in_range(cells, first_x, first_y, last_x, last_y):
+    """
+    This function returns the cells of a range to look up in a {cell: items} \
+        dictionary, going through the dictionary instead when it is smaller.
+    """
+    if (last_x - first_x + 1) * (last_y - first_y + 1) > len(cells):
+        return [cell for cell in cells
+                if first_x <= cell[0] <= last_x and first_y <= cell[1] <= last_y]
+    return [(x, y) for x in range(first_x, last_x + 1) for y in range(first_y, last_y + 1)]
+
+
+class OrderedSet(Sequence):
+    """
+    Set keeping the insertion order of its items.
+
+    Adding, removing and membership tests take constant time, and iterating follows \
+        the insertion order. Positional access (graph.nodes[0]) goes through a list of \
+        the items built on first use after a change.
+    """
+    def __init__(self, items=()):
+        # item -> number given when it was added, see order_of
+        self._numbers = count()
+        self._items = dict(zip(dict.fromkeys(items), self._numbers))
+        self._order = None
+
+    def append(self, item):
+        """
+        This method adds an item at the end (if not there already).
+        """
+        self._items.setdefault(item, next(self._numbers))
+        self._order = None
+
+    def remove(self, item):
+        """
+        This method removes an item, raising a ValueError if it is missing.
+        """
+        try:
+            del self._items[item]
+        except KeyError:
+            raise ValueError(f'{item!r} is not in the set') from None
+        self._order = None
+
+    def order_of(self, item) -> int:
+        """
+        This method returns a number growing with the insertion order of an item.
+        """
+        return self._items[item]
+
+    def copy(self):
+        """
+        This method returns a shallow copy of the set.
+        """
+        return OrderedSet(self._items)
+
+    def __getitem__(self, index):
+        if self._order is None:
+            self._order = list(self._items)
+        return self._order[index]
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, (OrderedSet, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'OrderedSet({list(self._items)!r})'
+
+
+class ComponentIndex:
+    """
+    Connected components of a graph, kept in a union-find structure.
+
+    Adding a node or a connection updates it in near-constant time (union by size and path \
+        halving). A removal can split a component, which union-find can not undo, so it only \
+        marks the index stale and the graph rebuilds it on the next query.
+
+    The components follow the links of the nodes, which the searches walk. Links made behind \
+        the back of the graph (a bare Connection) show in Node.link_edits and force a rebuild.
+    """
+    def __init__(self):
+        self._parent = {}
+        self._size = {}
+        self.stale = True
+        # Node.link_edits when the index last matched the links of the nodes
+        self.link_edits = None
+
+    def rebuild(self, graph):
+        """
+        This method recomputes the components of the graph.
+        """
+        self._parent = {node: node for node in graph.nodes}
+        self._size = dict.fromkeys(graph.nodes, 1)
+        for node in graph.nodes:
+            for neighbor, _ in node.neighbors:
+                if neighbor not in self._parent:  # linked without being in the graph
+                    self.add(neighbor)
+                self.union(node, neighbor)
+        self.stale = False
+        self.link_edits = Node.link_edits
+
+    def link(self, connection):
+        """
+        This method merges the components of the nodes of a connection, or marks the \
+            index stale when other links were made since it was last up to date.
+        """
+        if Node.link_edits - self.link_edits == 2 and Node.last_link is connection:
+            self.union(*connection.nodes)
+            self.link_edits = Node.link_edits
+        elif self.link_edits != Node.link_edits:
+            self.stale = True
+
+    def add(self, node):
+        """
+        This method adds a node as a component of its own.
+        """
+        self._parent[node] = node
+        self._size[node] = 1
+
+    def find(self, node):
+        """
+        This method returns the representative node of the component of a node.
+        """
+        parent = self._parent
+        if node not in parent:
+            return node
+        while parent[node] is not node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, node1, node2):
+        """
+        This method merges the components of two nodes.
+        """
+        root1, root2 = self.find(node1), self.find(node2)
+        if root1 is root2 or root1 not in self._parent or root2 not in self._parent:
+            return
+        if self._size[root1] < self._size[root2]:
+            root1, root2 = root2, root1
+        self._parent[root2] = root1
+        self._size[root1] += self._size.pop(root2)
+
+    def __len__(self):
+        return len(self._size)
+
+
+class Graph:  # pylint: disable=too-many-instance-attributes
     """Graph class"""
+    # besides the nodes and connections, the attributes are the results kept for
+    # compatibility, the version counters the caches are keyed on and the indexes
     def __init__(self, nodes=None, connections=None):
-        self.nodes = nodes
-        if self.nodes is None:
-            self.nodes = []
-        self.connections = connections
-        if self.connections is None:
-            self.connections = []
+        # insertion-ordered sets, so that removing a node or a connection is O(1)
+        self.nodes = OrderedSet(nodes or ())
+        self.connections = OrderedSet(connections or ())
         self.distances = {}
         self.preds = {}
+        # root of the complete shortest-path tree held in distances / preds
+        self.source = None
+        # (start, dest, connections) of the highlighted shortest path
+        self.route = None
+        # bumped by every edit that can change a shortest path
+        self.version = 0
+        # bumped when nodes are moved
+        self.layout_version = 0
+        # bumped when the look of nodes or connections changes
+        self.style_version = 0
+        self.grid = SpatialGrid()
+        for node in self.nodes:
+            self.grid.insert(node)
+        for connection in self.connections:
+            self.grid.insert_connection(connection)
+        # name -> (key, value) of the values derived from the whole graph, see memoize
+        self._derived = {}
+        # when set, every weight is claimed to be at least this factor times the
+        # euclidean length of its connection, which lets A* aim at the goal
+        self.euclidean_scale = None
+        # precomputed shortest paths answering queries while the graph is unchanged
+        # (see controllers.precomputed_route)
+        self.precomputed = None
+        self.components = ComponentIndex()
+
+    def replace(self, graph):
+        """
+        This method takes over the nodes and connections of another graph (a loaded \
+            one for instance), dropping everything computed on the previous ones.
+        """
+        self.nodes, self.connections, self.grid = graph.nodes, graph.connections, graph.grid
+        self.components = graph.components
+        self.euclidean_scale = graph.euclidean_scale
+        self.distances, self.preds = {}, {}
+        self.source = self.route = self.precomputed = None
+        self._derived = {}
+        # everything is drawn again
+        self.version += 1
+        self.layout_version += 1
+        self.style_version += 1
+
+    def add_node(self, node):
+        """
+        This method adds a node to the graph.
+        """
+        self.nodes.append(node)
+        self.grid.insert(node)
+        if not self.components.stale:
+            self.components.add(node)
+        self.version += 1
+
+    def remove_node(self, node):
+        """
+        This method removes a node and its connections from the graph and returns \
+            the removed connections.
+        """
+        removed = list(node.connections)
+        for connection in removed:
+            self.remove_connection(connection)
+        self.nodes.remove(node)
+        self.grid.remove(node)
+        self.version += 1
+        return removed
+
+    def move_node(self, node, pos):
+        """
+        This method moves a node of the graph to the given position.
+        """
+        # the cells of the connections depend on the positions of their nodes
+        indexed = [connection for connection in node.connections
+                   if connection in self.connections]
+        for connection in indexed:
+            self.grid.remove_connection(connection)
+        node.pos = pos
+        self.grid.move(node)
+        for connection in indexed:
+            self.grid.insert_connection(connection)
+        self.layout_version += 1
+
+    def restyle(self):
+        """
+        This method records that the look of some nodes or connections changed \
+            (text, color, selection or highlight) so that they are drawn again.
+        """
+        self.style_version += 1
+
+    def node_at(self, pos):
+        """
+        This method returns the earliest added node under the given position \
+            (None if there is no such node).
+        """
+        return min(self.grid.nodes_at(pos), key=lambda node: node.node_id, default=None)
+
+    def add_connection(self, connection):
+        """
+        This method adds a connection (already linked to its nodes) to the graph.
+        """
+        self.connections.append(connection)
+        self.grid.insert_connection(connection)
+        if not self.components.stale:
+            self.components.link(connection)
+        self.version += 1
 
     def remove_connection(self, connection):
         """
@@ -190,9 +811,148 @@ class Graph:
         """
         first_node = connection.nodes[0]
         second_node = connection.nodes[1]
-        first_node.remove_neighbor(second_node)
-        second_node.remove_neighbor(first_node)
+        first_node.remove_neighbor(second_node, connection)
+        second_node.remove_neighbor(first_node, connection)
         self.connections.remove(connection)
+        self.grid.remove_connection(connection)
+        self.components.stale = True
+        self.version += 1
+
+    def connected(self, node1, node2) -> bool:
+        """
+        This method returns whether a path links two nodes of the graph.
+        """
+        if self.components.stale or self.components.link_edits != Node.link_edits:
+            self.components.rebuild(self)
+        return self.components.find(node1) is self.components.find(node2)
+
+    def connection_between(self, node1, node2):
+        """
+        This method returns the connection between two nodes in constant time \
+            (None if the nodes are not connected).
+        """
+        return node1.connection_to(node2)
+
+    def freeze(self):
+        """
+        This method returns an immutable compressed-sparse-row snapshot of the graph. \
+            The snapshot is reused as long as the graph is not edited.
+        """
+        return self.memoize('freeze', self.version, lambda: GraphSnapshot(self))
+
+    def memoize(self, name, key, compute):
+        """
+        This method returns the value of compute(), computed again only when the key \
+            differs from the one it was last computed for under that name.
+        """
+        cached = self._derived.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key, compute())
+            self._derived[name] = cached
+        return cached[1]
+
+    def max_integer_weight(self):
+        """
+        This method returns the largest weight of the graph when every weight is a \
+            non-negative integer, None otherwise. The answer is kept until the next edit.
+        """
+        def compute():
+            bound = 0
+            for connection in self.connections:
+                weight = connection.weight
+                if not isinstance(weight, int) or weight < 0:
+                    return None
+                bound = max(bound, weight)
+            return bound
+        return self.memoize('max_integer_weight', self.version, compute)
+
+    def set_weight(self, connection, weight):
+        """
+        This method changes the weight of a connection of the graph.
+        """
+        if weight != connection.weight:
+            LABELS.evict(str(connection.weight))
+        connection.weight = weight
+        self.version += 1
+
+class GraphSnapshot:
+    """
+    Immutable compressed-sparse-row snapshot of a graph.
+
+    Node i is linked to targets[offsets[i]:offsets[i+1]] with the matching weights; \
+        edge_ids holds the index of the connection each entry comes from. Every \
+        connection appears once from each of its ends.
+    """
+    def __init__(self, graph: Graph):
+        self.version = graph.version
+        self._graph_id = id(graph)
+        self.nodes = tuple(graph.nodes)
+        self.connections = tuple(graph.connections)
+        self._index = {node: i for i, node in enumerate(self.nodes)}
+
+        degrees = [0] * (len(self.nodes) + 1)
+        for connection in self.connections:
+            degrees[self._index[connection.nodes[0]] + 1] += 1
+            degrees[self._index[connection.nodes[1]] + 1] += 1
+        for i in range(len(self.nodes)):
+            degrees[i + 1] += degrees[i]
+
+        self.offsets = array('q', degrees)
+        self.targets = array('q', bytes(8 * degrees[-1]))
+        self.weights = array('d', bytes(8 * degrees[-1]))
+        self.edge_ids = array('q', bytes(8 * degrees[-1]))
+        slots = degrees[:-1]
+        for edge_id, connection in enumerate(self.connections):
+            first, second = self._index[connection.nodes[0]], self._index[connection.nodes[1]]
+            for node, target in ((first, second), (second, first)):
+                slot = slots[node]
+                self.targets[slot] = target
+                self.weights[slot] = connection.weight
+                self.edge_ids[slot] = edge_id
+                slots[node] += 1
+        self.node_ids = array('q', (node.node_id for node in self.nodes))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def index_of(self, node: Node) -> int:
+        """
+        This method returns the index of a node in the snapshot arrays.
+        """
+        return self._index[node]
+
+    def is_stale(self, graph: Graph) -> bool:
+        """
+        This method checks whether the graph was edited since the snapshot was taken.
+        """
+        return id(graph) != self._graph_id or graph.version != self.version
+
+    def fingerprint(self) -> bytes:
+        """
+        This method returns a digest of the node ids and of the arrays, which identifies \
+            the graph across processes.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for name in ('node_ids', 'offsets', 'targets', 'weights', 'edge_ids'):
+            digest.update(getattr(self, name))
+        return digest.digest()
+
+    def buffers(self) -> dict:
+        """
+        This method returns read-only views on the snapshot arrays, without copying them.
+        """
+        return {name: memoryview(getattr(self, name)).toreadonly()
+                for name in ('offsets', 'targets', 'weights', 'edge_ids', 'node_ids')}
+
+    def as_numpy(self) -> dict:
+        """
+        This method returns read-only numpy arrays sharing the snapshot memory.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required to export a snapshot as numpy arrays')
+        return {name: numpy.frombuffer(buffer, dtype=buffer.format)
+                for name, buffer in self.buffers().items()}
+
 
 class Tool:
     """Tool class"""
@@ -219,8 +979,22 @@ class Tool:
         This is the 'handle mouse move' callback
         """
 
-    def render_preview(self, screen):
+    @property
+    def active_nodes(self):
+        """
+        This property returns the nodes the tool is currently moving around.
+        """
+        return ()
+
+    @property
+    def preview_state(self):
+        """
+        This property returns the values the preview depends on (None without preview).
+        """
+        return None
+
+    def render_preview(self, screen, camera=None):
         """
-        This method is responsible for rendering a preview of the object \
-            before it's placement.
+        This method is responsible for rendering a preview of the object before it's placement, \
+            as seen by the camera if given. It returns the area drawn (None if nothing was drawn).
         """
@@ -0,0 +1,353 @@
+"""
+Preprocessing module
+
+This is where the graphs are preprocessed to answer repeated shortest-path queries \
+    faster than a plain dijkstra
+"""
+
+import heapq
+import math
+from array import array
+
+from controllers import Route, a_star, dijkstra_snapshot
+from models import Graph, Node
+
+# nodes settled by a witness search before a shortcut is added anyway
+WITNESS_LIMIT = 64
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy of a graph.
+
+    The nodes are contracted one by one in order of importance (the number of \
+        shortcuts a contraction adds minus the connections it removes, plus the number \
+        of neighbors already contracted). Contracting a node links each pair of its \
+        remaining neighbors by a shortcut, unless a witness search finds a path at \
+        least as short without it.
+
+    A query is a bidirectional dijkstra that only follows connections and shortcuts \
+        towards more important nodes. Shortcuts remember the two edges they replace, \
+        so paths are unpacked back into the original connections.
+
+    The hierarchy answers for the graph as it was when it was built: any later edit \
+        makes covers return False, the queries falling back on the regular engines \
+        until build is called again.
+    """
+    def __init__(self, graph: Graph):
+        self.snapshot = None
+        self.rank = None
+        self.upward = None
+        self.shortcuts = None
+        self.build(graph)
+
+    def build(self, graph: Graph):
+        """
+        This method (re)computes the hierarchy of the graph.
+        """
+        self.snapshot = snapshot = graph.freeze()
+        # node index -> {neighbor index: (weight, edge id)} of the remaining nodes
+        adjacency = _adjacency(snapshot)
+
+        # edge ids past the connections are shortcuts: (node, other, edge, middle, edge)
+        self.shortcuts = []
+        self.rank = [0] * len(snapshot)
+        self.upward = [()] * len(snapshot)
+        contracted_neighbors = [0] * len(snapshot)
+        queue = [(len(_shortcuts(adjacency, node)) - len(adjacency[node]), node)
+                 for node in range(len(snapshot))]
+        heapq.heapify(queue)
+        rank = 0
+        while queue:
+            _, node = heapq.heappop(queue)
+            shortcuts = _shortcuts(adjacency, node)
+            importance = len(shortcuts) - len(adjacency[node]) + contracted_neighbors[node]
+            if queue and importance > queue[0][0]:
+                # lazy update: the node became more important than the next one
+                heapq.heappush(queue, (importance, node))
+                continue
+
+            self.rank[node] = rank
+            rank += 1
+            self.upward[node] = tuple((other, weight, edge_id)
+                                      for other, (weight, edge_id) in adjacency[node].items())
+            for first, second, weight in shortcuts:
+                edge_id = len(snapshot.connections) + len(self.shortcuts)
+                self.shortcuts.append((first, second, adjacency[node][first][1], node,
+                                       adjacency[node][second][1]))
+                adjacency[first][second] = adjacency[second][first] = (weight, edge_id)
+            for other in adjacency[node]:
+                del adjacency[other][node]
+                contracted_neighbors[other] += 1
+            adjacency[node] = {}
+
+    def covers(self, graph: Graph, _source: Node = None, _paths=False) -> bool:
+        """
+        This method returns whether the hierarchy is up to date with the graph.
+        """
+        return not self.snapshot.is_stale(graph)
+
+    def _search(self, source: int, dest: int) -> tuple:  # pylint: disable=too-many-locals
+        # returns (distance, meeting node, predecessors of both sides, settled count)
+        distances = ({source: 0}, {dest: 0})
+        preds = ({}, {})
+        queues = ([(0, source)], [(0, dest)])
+        best, meeting = math.inf, None
+        settled = 0
+        if source == dest:
+            return 0, source, preds, settled
+        while queues[0] or queues[1]:
+            for side in (0, 1):
+                queue = queues[side]
+                if not queue:
+                    continue
+                if queue[0][0] >= best:
+                    queue.clear()
+                    continue
+                distance, node = heapq.heappop(queue)
+                if distance > distances[side][node]:
+                    continue
+                settled += 1
+                other_distance = distances[1 - side].get(node)
+                if other_distance is not None and distance + other_distance < best:
+                    best, meeting = distance + other_distance, node
+                for other, weight, edge_id in self.upward[node]:
+                    new_distance = distance + weight
+                    if new_distance < distances[side].get(other, math.inf):
+                        distances[side][other] = new_distance
+                        preds[side][other] = (node, edge_id)
+                        heapq.heappush(queue, (new_distance, other))
+        return best, meeting, preds, settled
+
+    def _unpack(self, edge_id: int, start: int, out: list):
+        # appends the connections of an edge walked from its start node
+        stack = [(edge_id, start)]
+        edges = len(self.snapshot.connections)
+        while stack:
+            edge_id, start = stack.pop()
+            if edge_id < edges:
+                out.append(self.snapshot.connections[edge_id])
+                continue
+            first, _, first_edge, middle, second_edge = self.shortcuts[edge_id - edges]
+            if start == first:
+                stack.append((second_edge, middle))
+                stack.append((first_edge, start))
+            else:
+                stack.append((first_edge, middle))
+                stack.append((second_edge, start))
+
+    def distance(self, source: Node, dest: Node):
+        """
+        This method returns the distance between two nodes (math.inf if unreachable).
+        """
+        return self._search(self.snapshot.index_of(source), self.snapshot.index_of(dest))[0]
+
+    def route(self, source: Node, dest: Node) -> Route:
+        """
+        This method returns the (distance, path) between two nodes, the path being \
+            ordered like the result of find_path (None if unreachable).
+        """
+        best, meeting, preds, settled = self._search(self.snapshot.index_of(source),
+                                                     self.snapshot.index_of(dest))
+        if meeting is None:
+            return Route(best, None, settled)
+        # from the destination up to the meeting node, then down to the source
+        path = []
+        node = meeting
+        chain = []
+        while node in preds[1]:
+            node, edge_id = preds[1][node]
+            chain.append((edge_id, node))
+        for edge_id, start in reversed(chain):
+            self._unpack(edge_id, start, path)
+        node = meeting
+        while node in preds[0]:
+            previous, edge_id = preds[0][node]
+            self._unpack(edge_id, node, path)
+            node = previous
+        return Route(best, path, settled)
+
+
+class Landmarks:
+    """
+    Landmark distance tables of a graph, for A* searches guided by the triangle \
+        inequality (ALT).
+
+    The distances from every landmark to every node are kept in one array('d') per \
+        landmark. For any landmark L, |d(L, dest) - d(L, node)| is a lower bound of the \
+        distance between node and dest, whatever the weights mean, and the largest of \
+        these bounds is used as the A* heuristic.
+
+    Landmarks are picked far apart: either farthest-point (each one the node farthest \
+        from those already picked, in the component of the best connected node) or planar \
+        (the node farthest from the center of the drawing in each of count angular \
+        sectors). The tables are rebuilt on the first query after the graph changed.
+    """
+    SELECTIONS = ('farthest', 'planar')
+
+    def __init__(self, graph: Graph, count=8, selection='farthest'):
+        if selection not in Landmarks.SELECTIONS:
+            raise ValueError(f'unknown landmark selection {selection!r}')
+        self.graph = graph
+        self.count = count
+        self.selection = selection
+        self.snapshot = None
+        self.landmarks = ()
+        self.tables = []
+        self.build()
+
+    def build(self):
+        """
+        This method picks the landmarks and computes their distance tables.
+        """
+        self.snapshot = snapshot = self.graph.freeze()
+        self.tables = []
+        if self.selection == 'planar':
+            self.landmarks = self._planar_landmarks()
+            self.tables = [dijkstra_snapshot(snapshot, landmark)[0]
+                           for landmark in self.landmarks]
+            return
+
+        count = min(self.count, len(snapshot))
+        landmarks = []
+        closest = array('d', [math.inf]) * len(snapshot)
+        # the node farthest from the best connected one lies at the edge of the graph
+        hub = max(range(len(snapshot)),
+                  key=lambda node: snapshot.offsets[node + 1] - snapshot.offsets[node],
+                  default=None)
+        candidate = _farthest(dijkstra_snapshot(snapshot, hub)[0]) if count else None
+        while len(landmarks) < count:
+            distances = dijkstra_snapshot(snapshot, candidate)[0]
+            landmarks.append(candidate)
+            self.tables.append(distances)
+            for node, distance in enumerate(distances):
+                if distance < closest[node]:
+                    closest[node] = distance
+            candidate = _farthest(closest)
+            if closest[candidate] == 0:
+                break
+        self.landmarks = tuple(landmarks)
+
+    def _planar_landmarks(self) -> tuple:
+        nodes = self.snapshot.nodes
+        if not nodes:
+            return ()
+        center_x = sum(node.pos[0] for node in nodes) / len(nodes)
+        center_y = sum(node.pos[1] for node in nodes) / len(nodes)
+        farthest = {}
+        for i, node in enumerate(nodes):
+            delta_x, delta_y = node.pos[0] - center_x, node.pos[1] - center_y
+            sector = int((math.atan2(delta_y, delta_x) + math.pi) / (2 * math.pi)
+                         * self.count) % self.count
+            radius = math.hypot(delta_x, delta_y)
+            if radius >= farthest.get(sector, (-1, None))[0]:
+                farthest[sector] = (radius, i)
+        return tuple(i for _, i in farthest.values())
+
+    def covers(self, graph: Graph, _source: Node = None, _paths=False) -> bool:
+        """
+        This method returns whether the tables belong to the graph, rebuilding them \
+            first if the graph changed since they were computed.
+        """
+        if graph is not self.graph:
+            return False
+        if self.snapshot.is_stale(graph):
+            self.build()
+        return True
+
+    def heuristic(self, dest: Node):
+        """
+        This method returns the A* heuristic of a search towards dest: a function of \
+            a node returning a lower bound of its distance to dest (math.inf when it \
+            can not reach dest).
+        """
+        index_of = self.snapshot.index_of
+        dest_index = index_of(dest)
+        bounds = [(table[dest_index], table) for table in self.tables
+                  if table[dest_index] < math.inf]
+
+        def heuristic(node):
+            index = index_of(node)
+            return max((abs(dest_distance - table[index]) for dest_distance, table in bounds),
+                       default=0)
+        return heuristic
+
+    def distance(self, source: Node, dest: Node):
+        """
+        This method returns the distance between two nodes (math.inf if unreachable).
+        """
+        return self.route(source, dest)[0]
+
+    def route(self, source: Node, dest: Node) -> Route:
+        """
+        This method returns the (distance, path) between two nodes found by A*, the \
+            path being ordered like the result of find_path (None if unreachable).
+        """
+        heuristic = self.heuristic(dest)
+        if heuristic(source) == math.inf:
+            return Route(math.inf, None, 0)
+        return a_star(self.graph, source, dest, heuristic)
+
+
+def _farthest(distances) -> int:
+    """
+    This function returns the index of the largest finite distance.
+    """
+    return max((node for node, distance in enumerate(distances) if distance < math.inf),
+               key=distances.__getitem__)
+
+
+def _adjacency(snapshot) -> list:
+    """
+    This function returns the {neighbor index: (weight, edge id)} dictionary of every \
+        node of a snapshot, keeping the lightest of parallel connections and leaving \
+        out loops.
+    """
+    adjacency = [{} for _ in range(len(snapshot))]
+    for node in range(len(snapshot)):
+        for slot in range(snapshot.offsets[node], snapshot.offsets[node + 1]):
+            target, weight = snapshot.targets[slot], snapshot.weights[slot]
+            if target != node and weight < adjacency[node].get(target, (math.inf,))[0]:
+                adjacency[node][target] = (weight, snapshot.edge_ids[slot])
+    return adjacency
+
+
+def _shortcuts(adjacency, node) -> list:
+    """
+    This function returns the (neighbor, neighbor, weight) shortcuts needed to contract \
+        a node, the pairs linked by a witness path no longer than through the node \
+        being left out.
+    """
+    neighbors = list(adjacency[node].items())
+    shortcuts = []
+    for i, (first, (first_weight, _)) in enumerate(neighbors[:-1]):
+        targets = {second: first_weight + weight
+                   for second, (weight, _) in neighbors[i + 1:]}
+        witnesses = _witness_search(adjacency, first, node, max(targets.values()))
+        for second, weight in targets.items():
+            if witnesses.get(second, math.inf) > weight:
+                shortcuts.append((first, second, weight))
+    return shortcuts
+
+
+def _witness_search(adjacency, source, excluded, limit) -> dict:
+    """
+    This function returns the distances found by a dijkstra from source that avoids \
+        the excluded node, stops past the limit distance or WITNESS_LIMIT settled nodes.
+    """
+    distances = {source: 0}
+    queue = [(0, source)]
+    settled = 0
+    while queue and settled < WITNESS_LIMIT:
+        distance, node = heapq.heappop(queue)
+        if distance > limit:
+            break
+        if distance > distances[node]:
+            continue
+        settled += 1
+        for other, (weight, _) in adjacency[node].items():
+            new_distance = distance + weight
+            if other != excluded and new_distance < distances.get(other, math.inf):
+                distances[other] = new_distance
+                heapq.heappush(queue, (new_distance, other))
+    return distances
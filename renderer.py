@@ -0,0 +1,184 @@
+"""
+Renderer module
+
+This is where the graph is drawn in the pygame window
+"""
+
+import pygame
+
+
+class Camera:
+    """
+    Camera class
+
+    The camera maps the world positions of the nodes to the screen: a world position \
+        p is drawn at (p - offset) * zoom.
+    """
+    MIN_ZOOM = 0.05
+    MAX_ZOOM = 8
+
+    def __init__(self):
+        self.offset = (0.0, 0.0)
+        self.zoom = 1.0
+        # whether labels and full shapes are drawn (see Renderer.lod_threshold)
+        self.detailed = True
+
+    @property
+    def state(self):
+        """
+        This property returns the values the drawing depends on.
+        """
+        return (self.offset, self.zoom, self.detailed)
+
+    def to_screen(self, pos):
+        """
+        This method returns the screen position of a world position.
+        """
+        return (round((pos[0] - self.offset[0]) * self.zoom),
+                round((pos[1] - self.offset[1]) * self.zoom))
+
+    def to_world(self, pos):
+        """
+        This method returns the world position of a screen position.
+        """
+        return (round(pos[0] / self.zoom + self.offset[0]),
+                round(pos[1] / self.zoom + self.offset[1]))
+
+    def viewport(self, size):
+        """
+        This method returns the (left, top, right, bottom) world rectangle seen on a \
+            screen of the given size.
+        """
+        return (self.offset[0], self.offset[1],
+                self.offset[0] + size[0] / self.zoom, self.offset[1] + size[1] / self.zoom)
+
+    def pan(self, delta):
+        """
+        This method moves the view by the given screen distance.
+        """
+        self.offset = (self.offset[0] - delta[0] / self.zoom,
+                       self.offset[1] - delta[1] / self.zoom)
+
+    def zoom_at(self, pos, factor):
+        """
+        This method zooms by the given factor, keeping the screen position pos in place.
+        """
+        world_x = pos[0] / self.zoom + self.offset[0]
+        world_y = pos[1] / self.zoom + self.offset[1]
+        self.zoom = min(max(self.zoom * factor, Camera.MIN_ZOOM), Camera.MAX_ZOOM)
+        self.offset = (world_x - pos[0] / self.zoom, world_y - pos[1] / self.zoom)
+
+
+def _intersects(connection, viewport):
+    (x_1, y_1), (x_2, y_2) = connection.nodes[0].pos, connection.nodes[1].pos
+    return min(x_1, x_2) <= viewport[2] and max(x_1, x_2) >= viewport[0] and \
+        min(y_1, y_2) <= viewport[3] and max(y_1, y_2) >= viewport[1]
+
+
+class Renderer:
+    """
+    Renderer class
+
+    The graph is drawn once on a cached background surface. As long as the graph, \
+        its look, the camera and the nodes moved by the tool stay the same, a frame \
+        only restores the background under the previous dynamic items (nodes moved by \
+        the tool, their connections, hovered nodes and the tool preview), draws them \
+        again and returns the dirty rectangles to push to the display.
+
+    Only the nodes and connections inside the camera viewport are drawn, both found \
+        through the spatial grid of the graph so that a frame does not depend on the \
+        size of the graph, and past lod_threshold visible nodes (or below lod_zoom) \
+        they are drawn without labels, as points and thin lines.
+    """
+    def __init__(self, screen, font, background_color):
+        self.screen = screen
+        self.font = font
+        self.background_color = background_color
+        self.camera = Camera()
+        self.lod_threshold = 500
+        self.lod_zoom = 0.4
+        self.background = None
+        self._key = None
+        self._frame = None
+        self._dirty = []
+
+    def _background_key(self, graph, moving):
+        # positions of moving nodes are drawn every frame, so their moves are ignored
+        layout_version = None if moving else graph.layout_version
+        return (graph.version, graph.style_version, layout_version, moving,
+                self.screen.get_size(), self.camera.offset, self.camera.zoom)
+
+    def _draw_background(self, graph, moving):
+        if self.background is None or self.background.get_size() != self.screen.get_size():
+            self.background = pygame.Surface(self.screen.get_size())
+        self.background.fill(self.background_color)
+
+        camera = self.camera
+        viewport = camera.viewport(self.screen.get_size())
+        visible = sorted(graph.grid.nodes_in_rect(*viewport), key=lambda node: node.node_id)
+        camera.detailed = len(visible) <= self.lod_threshold and camera.zoom >= self.lod_zoom
+
+        connections = [connection for connection in graph.grid.connections_in_rect(*viewport)
+                       if connection.nodes[0] not in moving and connection.nodes[1] not in moving
+                       and connection in graph.connections and _intersects(connection, viewport)]
+        # in the order they were added to the graph, whatever cells the viewport covers,
+        # the highlighted connections on top of the others
+        connections.sort(key=graph.connections.order_of)
+        for connection in sorted(connections, key=lambda conn: conn.is_highlighted):
+            connection.render(self.background, self.font, camera)
+        for node in visible:
+            if node not in moving:
+                node.render(self.background, self.font, hovered=False, camera=camera)
+
+    def _draw_dynamic(self, graph, tool, moving, hovered):
+        camera = self.camera
+        dirty = []
+        for node in moving:
+            for neighbor, connection in node.neighbors:
+                if neighbor not in moving or neighbor.node_id < node.node_id:
+                    dirty.append(connection.render(self.screen, self.font, camera))
+
+        # nodes covered by the redrawn connections are put back on top of them
+        covered = set()
+        for area in dirty:
+            covered.update(graph.grid.nodes_in_rect(
+                *camera.to_world(area.topleft), *camera.to_world(area.bottomright)))
+        for node in sorted(covered - moving, key=lambda node: node.node_id):
+            dirty.append(node.render(self.screen, self.font, camera=camera))
+
+        for node in sorted(moving | hovered, key=lambda node: node.node_id):
+            dirty.append(node.render(self.screen, self.font, camera=camera))
+
+        preview = tool.render_preview(self.screen, camera)
+        if preview is not None:
+            dirty.append(preview)
+        return dirty
+
+    def render(self, graph, tool, hovered=frozenset()):
+        """
+        This method brings the window up to date and returns the rectangles of the \
+            screen that changed (an empty list when nothing did).
+        """
+        moving = frozenset(tool.active_nodes)
+        hovered = {node for node in hovered if node.hovered and node in graph.grid}
+        key = self._background_key(graph, moving)
+        frame = (tuple((node, node.pos) for node in moving), frozenset(hovered),
+                 tool.preview_state)
+
+        if key != self._key:
+            self._key = key
+            self._frame = frame
+            self._draw_background(graph, moving)
+            self.screen.blit(self.background, (0, 0))
+            self._dirty = self._draw_dynamic(graph, tool, moving, hovered)
+            return [self.screen.get_rect()]
+
+        if frame == self._frame:
+            return []
+        self._frame = frame
+
+        previous = self._dirty
+        for area in previous:
+            self.screen.blit(self.background, area, area)
+        self._dirty = self._draw_dynamic(graph, tool, moving, hovered)
+        return previous + self._dirty
@@ -0,0 +1,314 @@
+"""
+Storage module
+
+This is where graphs and precomputed shortest paths are written to and read from disk
+"""
+
+import mmap
+import struct
+
+from batch import iter_rows
+from controllers import Route, snapshot_path
+from models import Connection, Graph, GraphSnapshot, Node
+
+GRAPH_MAGIC = b'DIJKGRPH'
+GRAPH_FORMAT = 1
+# magic, format, flags, nodes, connections, string table size (native order)
+_GRAPH_HEADER = struct.Struct('=8sIIQQQ8x')
+# id, x, y, text offset, text size, red, green, blue
+_NODE_RECORD = struct.Struct('=qddIIBBB5x')
+# first node index, second node index, weight, red, green, blue, integer weight
+_CONNECTION_RECORD = struct.Struct('=qqdBBBB4x')
+
+DISTANCES_MAGIC = b'DIJKDIST'
+DISTANCES_FORMAT = 1
+# magic, format, flags, nodes, sources, graph version, graph fingerprint (native order)
+_HEADER = struct.Struct('=8sIIQQQ16s8x')
+_NEXT_HOPS = 1
+
+
+class DistanceStoreWriter:
+    """
+    Writer of a distance matrix file, row by row.
+
+    The file starts with a 64 bytes header, followed by the snapshot index of every \
+        source (int64), the distances from every source to every node (float64, one \
+        row per source) and, when next_hops is set, a table with the same layout \
+        holding the index of the connection leading from each node one step back \
+        towards the source (-1 for the source and the unreached nodes). Every array \
+        is stored in native byte order.
+
+    The file gets its final size when opened, so rows can be written in any order.
+    """
+    def __init__(self, path, snapshot: GraphSnapshot, sources, next_hops=True):
+        self.snapshot = snapshot
+        self.sources = list(sources)
+        self.next_hops = next_hops
+        self._rows = {source: i for i, source in enumerate(self.sources)}
+        cells = len(self.sources) * len(snapshot)
+        self._distances_at = _HEADER.size + 8 * len(self.sources)
+        self._next_hops_at = self._distances_at + 8 * cells
+
+        self._file = open(path, 'wb')  # pylint: disable=consider-using-with
+        self._file.write(_HEADER.pack(DISTANCES_MAGIC, DISTANCES_FORMAT,
+                                      _NEXT_HOPS if next_hops else 0, len(snapshot),
+                                      len(self.sources), snapshot.version,
+                                      snapshot.fingerprint()))
+        self._file.write(struct.pack(f'={len(self.sources)}q', *self.sources))
+        self._file.truncate(self._next_hops_at + (8 * cells if next_hops else 0))
+
+    def write_row(self, source: int, distances, pred_edges=None):
+        """
+        This method writes the distances (and next hops) computed from a source, given \
+            as arrays indexed like the snapshot nodes.
+        """
+        row = self._rows[source] * 8 * len(self.snapshot)
+        self._file.seek(self._distances_at + row)
+        self._file.write(distances)
+        if self.next_hops:
+            self._file.seek(self._next_hops_at + row)
+            self._file.write(pred_edges)
+
+    def close(self):
+        """
+        This method closes the file.
+        """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def save_distances(path, graph: Graph, sources=None, processes=None, next_hops=True):
+    """
+    This function computes the shortest paths from the source nodes (every node by \
+        default) with batch.iter_rows and writes them to a distance matrix file as they \
+        come, without keeping the matrix in memory.
+    """
+    snapshot = graph.freeze()
+    if sources is None:
+        sources = graph.nodes
+    rows = [snapshot.index_of(source) for source in dict.fromkeys(sources)]
+    with DistanceStoreWriter(path, snapshot, rows, next_hops) as writer:
+        for source, distances, pred_edges in iter_rows(snapshot, rows, processes, next_hops):
+            writer.write_row(source, distances, pred_edges)
+
+
+class DistanceStore:
+    """
+    Distance matrix file opened with mmap, see DistanceStoreWriter.
+
+    The file is checked against the fingerprint of the graph it is opened for, and \
+        lookups read the mapped file in place. The store only answers for the graph \
+        as it was when it was opened: any later edit makes covers return False.
+    """
+    def __init__(self, path, graph: Graph):
+        self.snapshot = graph.freeze()
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, file_format, flags, size, sources, _, fingerprint = \
+                _HEADER.unpack_from(self._map)
+            if magic != DISTANCES_MAGIC or file_format != DISTANCES_FORMAT:
+                raise ValueError(f'{path} is not a distance matrix file')
+            if size != len(self.snapshot) or fingerprint != self.snapshot.fingerprint():
+                raise ValueError(f'{path} was computed for another graph')
+            tables = 2 if flags & _NEXT_HOPS else 1
+            if len(self._map) < _HEADER.size + 8 * sources * (1 + size * tables):
+                raise ValueError(f'{path} is truncated')
+            rows = struct.unpack_from(f'={sources}q', self._map, _HEADER.size)
+            if any(not 0 <= source < size for source in rows):
+                raise ValueError(f'{path} holds a source missing from the graph')
+            view = memoryview(self._map)
+            start = _HEADER.size
+            self._views = [view[start:start + 8 * sources].cast('q')]
+            start += 8 * sources
+            self._views.append(view[start:start + 8 * sources * size].cast('d'))
+            if flags & _NEXT_HOPS:
+                start += 8 * sources * size
+                self._views.append(view[start:start + 8 * sources * size].cast('q'))
+            view.release()
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+        self.distances = self._views[1]
+        self.next_hops = self._views[2] if len(self._views) == 3 else None
+        nodes = self.snapshot.nodes
+        self._rows = {nodes[source]: i * size for i, source in enumerate(rows)}
+
+    def covers(self, graph: Graph, source: Node, paths=False) -> bool:
+        """
+        This method returns whether the store holds the current shortest paths of the \
+            graph from source (and the paths themselves if asked for).
+        """
+        return not self.snapshot.is_stale(graph) and source in self._rows and \
+            (not paths or self.next_hops is not None)
+
+    def distance(self, source: Node, dest: Node):
+        """
+        This method returns the distance between a source node and a node \
+            (math.inf if it can not be reached).
+        """
+        return self.distances[self._rows[source] + self.snapshot.index_of(dest)]
+
+    def path(self, source: Node, dest: Node) -> list[Connection]:
+        """
+        This method rebuilds the path between a source node and a node from the next \
+            hops, ordered like the result of find_path (None if it can not be reached).
+        """
+        if self.next_hops is None:
+            raise ValueError('the distance matrix was saved without next hops')
+        return snapshot_path(self.snapshot, self.next_hops, source, dest, self._rows[source])
+
+    def route(self, source: Node, dest: Node) -> Route:
+        """
+        This method returns the (distance, path) between a source node and a node, \
+            read from the file without any search.
+        """
+        return Route(self.distance(source, dest), self.path(source, dest), 0)
+
+    def close(self):
+        """
+        This method unmaps the file.
+        """
+        for view in self._views:
+            view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def save_graph(path, graph: Graph):
+    """
+    This function writes a graph to a graph file, see GraphFile.
+    """
+    index = {node: i for i, node in enumerate(graph.nodes)}
+    strings = bytearray()
+    records = []
+    for node in graph.nodes:
+        text = node.text.encode()
+        records.append(_NODE_RECORD.pack(node.node_id, *node.pos, len(strings), len(text),
+                                         *node.color))
+        strings += text
+    for connection in graph.connections:
+        records.append(_CONNECTION_RECORD.pack(
+            index[connection.nodes[0]], index[connection.nodes[1]], connection.weight,
+            *connection.color, isinstance(connection.weight, int)))
+
+    with open(path, 'wb') as file:
+        file.write(_GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_FORMAT, 0, len(graph.nodes),
+                                      len(graph.connections), len(strings)))
+        file.write(b''.join(records))
+        file.write(strings)
+
+
+class GraphFile:
+    """
+    Graph file opened with mmap.
+
+    The file starts with a 48 bytes header, followed by one 40 bytes record per node \
+        (id, position, color and the place of its text in the string table), one 32 \
+        bytes record per connection (index of both nodes, weight and color) and the \
+        string table holding the utf-8 texts of the nodes. Numbers are stored in native \
+        byte order.
+
+    Opening the file only maps it and node builds a single node on first use. load, \
+        and so load_graph and the Open button of the window, still builds every node and \
+        connection up front: the renderer, the spatial grid and the engines all walk the \
+        objects of the graph.
+
+    Records pointing outside the file (a node index past the nodes, a text past the \
+        string table) raise ValueError.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, file_format, _, nodes, connections, strings = \
+                _GRAPH_HEADER.unpack_from(self._map)
+            if magic != GRAPH_MAGIC:
+                raise ValueError(f'{path} is not a graph file')
+            if file_format != GRAPH_FORMAT:
+                raise ValueError(f'{path} uses the unsupported format {file_format}')
+            self._connections_at = _GRAPH_HEADER.size + nodes * _NODE_RECORD.size
+            self._strings_at = self._connections_at + connections * _CONNECTION_RECORD.size
+            if len(self._map) < self._strings_at + strings:
+                raise ValueError(f'{path} is truncated')
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+        self.connection_count = connections
+        self._strings_size = strings
+        self._nodes = [None] * nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def node(self, index: int) -> Node:
+        """
+        This method returns the node at the given index, building it on first use.
+        """
+        node = self._nodes[index]
+        if node is None:
+            node_id, pos_x, pos_y, start, size, red, green, blue = _NODE_RECORD.unpack_from(
+                self._map, _GRAPH_HEADER.size + index * _NODE_RECORD.size)
+            if start + size > self._strings_size:
+                raise ValueError(f'node {index} has its text outside the string table')
+            start += self._strings_at
+            node = Node(self._map[start:start + size].decode(), (_number(pos_x), _number(pos_y)),
+                        node_id)
+            node.color = (red, green, blue)
+            self._nodes[index] = node
+        return node
+
+    def load(self) -> Graph:
+        """
+        This method builds the whole graph.
+        """
+        nodes = [self.node(i) for i in range(len(self))]
+        count = len(nodes)
+        connections = []
+        with memoryview(self._map) as view:
+            with view[self._connections_at:self._strings_at] as records:
+                for first, second, weight, red, green, blue, integer in \
+                        _CONNECTION_RECORD.iter_unpack(records):
+                    if not (0 <= first < count and 0 <= second < count):
+                        raise ValueError(f'connection {len(connections)} links a node '
+                                         'missing from the file')
+                    connections.append(Connection((nodes[first], nodes[second]),
+                                                  int(weight) if integer else weight,
+                                                  (red, green, blue)))
+        return Graph(nodes, connections)
+
+    def close(self):
+        """
+        This method unmaps the file.
+        """
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _number(value: float):
+    # positions are usually whole pixels
+    return int(value) if value.is_integer() else value
+
+
+def load_graph(path) -> Graph:
+    """
+    This function reads a graph written by save_graph, building all of its nodes and \
+        connections (see GraphFile).
+    """
+    with GraphFile(path) as graph_file:
+        return graph_file.load()
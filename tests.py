@@ -2,11 +2,21 @@
 This module is contains the different tests to be run by unittest
 """
 
+import copy
 import math
+import os
 import random
+import struct
+import tempfile
 import unittest
-from models import Connection, Node, Graph, random_color, random_position
+import pygame
+from models import (Connection, LabelCache, Node, Graph, Tool, random_color,
+                    random_position)
+from renderer import Camera, Renderer
+import batch
 import controllers
+import preprocessing
+import storage
 
 nodes = [
     Node('0'),
@@ -73,6 +83,277 @@ class TestControllersMethods(unittest.TestCase):
         min_d = controllers.find_min_distance(graph, nodes[0], nodes[8])
         self.assertEqual(min_d, 14)
 
+    def test_find_min_distances(self):
+        """
+        This test function tests the 'find_min_distances(g, n, targets)' method
+        """
+        min_ds = controllers.find_min_distances(graph, nodes[0], [nodes[1], nodes[7]])
+        self.assertEqual(min_ds, {nodes[1]: 4, nodes[7]: 8})
+        # the search stopped before reaching the far side of the graph
+        partial = controllers.search(graph, nodes[0], [nodes[1], nodes[7]])
+        self.assertEqual(partial.distance(nodes[4]), math.inf)
+
+    def test_bidirectional_dijkstra(self):
+        """
+        This test function tests the 'bidirectional_dijkstra(g, n1, n2)' method
+        """
+        for start in nodes:
+            controllers.dijkstra(graph, start)
+            for dest in nodes:
+                distance, path = controllers.bidirectional_dijkstra(graph, start, dest)
+                self.assertEqual(distance, graph.distances[dest])
+                self.assertEqual(sum(conn.weight for conn in path), distance)
+                if path:
+                    self.assertIn(dest, path[0].nodes)
+                    self.assertIn(start, path[-1].nodes)
+
+        node_a, isolated = Node('a'), Node('x')
+        self.assertEqual(controllers.bidirectional_dijkstra(Graph([node_a, isolated]),
+                                                            node_a, isolated), (math.inf, None))
+
+    def test_routes(self):
+        """
+        This test function tests the 'Route' results of the single-pair engines
+        """
+        full = controllers.search(graph, nodes[0])
+        for engine in (controllers.bidirectional_dijkstra, controllers.a_star,
+                       controllers.shortest_path):
+            route = engine(graph, nodes[0], nodes[4])
+            self.assertIsInstance(route, controllers.Route)
+            self.assertEqual(route.distance, full.distance(nodes[4]))
+            self.assertEqual(route.path, full.path(nodes[4]))
+            self.assertTrue(0 < route.settled <= len(nodes))
+            with self.assertRaises(AttributeError):
+                route.settled = 0
+
+        hierarchy = preprocessing.ContractionHierarchy(graph)
+        route = hierarchy.route(nodes[0], nodes[4])
+        self.assertEqual(route.distance, full.distance(nodes[4]))
+        self.assertGreater(route.settled, 0)
+        self.assertEqual(tuple(controllers.Route(math.inf, None, 0)), (math.inf, None))
+
+    def test_a_star(self):
+        """
+        This test function tests the 'a_star(g, n1, n2)' method
+        """
+        node_a, node_b, node_c = Node('a', (0, 0)), Node('b', (30, 40)), Node('c', (60, 80))
+        local_graph = Graph([node_a, node_b, node_c], [
+            Connection((node_a, node_b), 50),
+            Connection((node_b, node_c), 60),
+            Connection((node_a, node_c), 120)
+        ])
+        self.assertFalse(controllers.heuristic_is_admissible(local_graph))
+        local_graph.euclidean_scale = 1
+        self.assertTrue(controllers.heuristic_is_admissible(local_graph))
+        distance, path = controllers.a_star(local_graph, node_a, node_c)
+        self.assertEqual(distance, 110)
+        self.assertEqual([conn.weight for conn in path], [60, 50])
+
+        # a weight shorter than the straight line makes the heuristic inadmissible
+        local_graph.set_weight(local_graph.connections[2], 90)
+        self.assertFalse(controllers.heuristic_is_admissible(local_graph))
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_c)[0], 90)
+
+        # the cached answer follows the weights, the positions and the scale
+        local_graph.set_weight(local_graph.connections[2], 120)
+        self.assertTrue(controllers.heuristic_is_admissible(local_graph))
+        local_graph.move_node(node_c, (300, 400))
+        self.assertFalse(controllers.heuristic_is_admissible(local_graph))
+        local_graph.euclidean_scale = 0.1
+        self.assertTrue(controllers.heuristic_is_admissible(local_graph))
+
+    def test_shortest_paths(self):
+        """
+        This test function tests the 'ShortestPaths' results returned by 'search'
+        """
+        graph.distances = {}
+        result = controllers.search(graph, nodes[0])
+        self.assertEqual(graph.distances, {})
+        self.assertTrue(result.complete)
+        self.assertEqual([result.distance(node) for node in nodes],
+                         [0, 4, 12, 19, 21, 11, 9, 8, 14])
+        self.assertEqual(sum(conn.weight for conn in result.path(nodes[4])), 21)
+        with self.assertRaises(TypeError):
+            result.distances[nodes[0]] = 1
+
+        partial = controllers.search(graph, nodes[0], [nodes[1]])
+        self.assertFalse(partial.complete)
+        self.assertEqual(partial.distance(nodes[1]), 4)
+        self.assertEqual(result.distance(nodes[1]), 4)
+
+        self.assertIs(controllers.dijkstra(graph, nodes[0]).source, nodes[0])
+        self.assertIs(graph.source, nodes[0])
+
+    def test_shortest_path_cache(self):
+        """
+        This test function tests the 'ShortestPathCache' class with 'shortest_path'
+        """
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 2))
+        local_graph.add_connection(Connection((node_b, node_c), 3))
+        cache = controllers.ShortestPathCache(max_entries=1)
+
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_c, cache)[0], 5)
+        tree = cache.get(node_a, local_graph.version)
+        self.assertIsNotNone(tree)
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_b, cache)[0], 2)
+        self.assertIs(cache.get(node_a, local_graph.version), tree)
+
+        # an edit bumps the graph version so the tree is recomputed
+        local_graph.set_weight(local_graph.connections[0], 1)
+        self.assertIsNone(cache.get(node_a, local_graph.version))
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_c, cache)[0], 4)
+
+        controllers.shortest_path(local_graph, node_c, node_a, cache)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get(node_a, local_graph.version))
+
+    def test_repair_shortest_paths(self):
+        """
+        This test function tests the incremental 'repair_*' methods against 'dijkstra'
+        """
+        local_nodes = [Node(str(i)) for i in range(5)]
+        local_graph = Graph(list(local_nodes))
+        for i, j, weight in [(0, 1, 1), (1, 2, 1), (2, 3, 1), (0, 3, 5), (3, 4, 1)]:
+            local_graph.add_connection(Connection((local_nodes[i], local_nodes[j]), weight))
+        controllers.dijkstra(local_graph, local_nodes[0])
+
+        def check():
+            distances, preds = dict(local_graph.distances), dict(local_graph.preds)
+            for node, conn in preds.items():
+                self.assertEqual(distances[conn.other_node(node)] + conn.weight, distances[node])
+            controllers.dijkstra(local_graph, local_nodes[0])
+            self.assertEqual(distances, local_graph.distances)
+
+        conn = local_graph.connections[1]
+        local_graph.set_weight(conn, 10)
+        controllers.repair_weight_change(local_graph, conn, 1)
+        self.assertEqual(local_graph.distances[local_nodes[3]], 5)
+        check()
+
+        local_graph.set_weight(conn, 0)
+        controllers.repair_weight_change(local_graph, conn, 10)
+        self.assertEqual(local_graph.distances[local_nodes[4]], 3)
+        check()
+
+        conn = Connection((local_nodes[0], local_nodes[4]), 1)
+        local_graph.add_connection(conn)
+        controllers.repair_decrease(local_graph, conn)
+        check()
+
+        local_graph.remove_connection(conn)
+        controllers.repair_increase(local_graph, conn)
+        check()
+
+        removed = local_graph.remove_node(local_nodes[2])
+        controllers.repair_removed_node(local_graph, local_nodes[2], removed)
+        self.assertEqual(local_graph.distances[local_nodes[4]], 6)
+        check()
+
+    def test_dijkstra_snapshot(self):
+        """
+        This test function tests the 'dijkstra_snapshot(s, i)' method
+        """
+        snapshot = graph.freeze()
+        self.assertIs(graph.freeze(), snapshot)
+        self.assertFalse(snapshot.is_stale(graph))
+        distances, pred_edges = controllers.dijkstra_snapshot(snapshot, snapshot.index_of(nodes[0]))
+        controllers.dijkstra(graph, nodes[0])
+        for node in nodes:
+            self.assertEqual(distances[snapshot.index_of(node)], graph.distances[node])
+        path = controllers.snapshot_path(snapshot, pred_edges, nodes[0], nodes[4])
+        self.assertEqual(sum(conn.weight for conn in path), 21)
+        self.assertIn(nodes[4], path[0].nodes)
+        self.assertEqual(snapshot.buffers()['offsets'][-1], 2 * len(connections))
+
+    def test_integer_queues(self):
+        """
+        This test function tests 'dijkstra' with the integer weights priority queues
+        """
+        self.assertEqual(graph.max_integer_weight(), 14)
+        self.assertIsInstance(controllers.make_queue(graph), controllers.BucketQueue)
+        local_nodes = [Node(str(i)) for i in range(4)]
+        local_graph = Graph(list(local_nodes))
+        for i, j, weight in [(0, 1, 1000), (1, 2, 0), (0, 2, 1500), (2, 3, 70000)]:
+            local_graph.add_connection(Connection((local_nodes[i], local_nodes[j]), weight))
+        self.assertIsInstance(controllers.make_queue(local_graph), controllers.RadixHeap)
+        controllers.dijkstra(local_graph, local_nodes[0])
+        self.assertEqual([local_graph.distances[node] for node in local_nodes],
+                         [0, 1000, 1000, 71000])
+
+        local_graph.set_weight(local_graph.connections[1], 0.5)
+        self.assertIsNone(local_graph.max_integer_weight())
+        self.assertIsInstance(controllers.make_queue(local_graph), controllers.BinaryHeap)
+
+    def test_integer_queues_out_of_range(self):
+        """
+        This test function tests that 'search' stays exact when the weight bound of the \
+            integer queues is out of date
+        """
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 1))
+        local_graph.add_connection(Connection((node_b, node_c), 1))
+        self.assertEqual(controllers.search(local_graph, node_a).distance(node_c), 2)
+
+        # weights changed behind the graph's back, and a connection it does not know of
+        local_graph.connections[0].weight = 10
+        self.assertEqual(controllers.search(local_graph, node_a).distance(node_c), 11)
+        Connection((node_a, node_c), 300)
+        local_graph.connections[1].weight = 0.5
+        self.assertEqual(controllers.search(local_graph, node_a).distance(node_c), 10.5)
+
+        with self.assertRaises(ValueError):
+            controllers.BucketQueue(1).push(2, node_a)
+        radix_heap = controllers.RadixHeap()
+        radix_heap.push(5, node_a)
+        radix_heap.push(7, node_b)
+        self.assertEqual(radix_heap.pop(), (5, node_a))
+        with self.assertRaises(ValueError):
+            radix_heap.push(4, node_c)
+        self.assertEqual(list(radix_heap.entries()), [(7, node_b)])
+
+    def test_shortest_path_job(self):
+        """
+        This test function tests the 'ShortestPathJob' worker thread
+        """
+        snapshot = graph.freeze()
+        job = controllers.ShortestPathJob(snapshot, snapshot.index_of(nodes[0]))
+        job.start()
+        job.join()
+        self.assertEqual(job.progress, 1.0)
+        result = controllers.tree_from_snapshot(snapshot, job.source, *job.result)
+        self.assertEqual(result.distance(nodes[4]), 21)
+        self.assertEqual(sum(conn.weight for conn in result.path(nodes[4])), 21)
+
+        step, controllers.PROGRESS_STEP = controllers.PROGRESS_STEP, 1
+        try:
+            job = controllers.ShortestPathJob(snapshot, snapshot.index_of(nodes[0]))
+            job.cancel()
+            job.start()
+            job.join()
+        finally:
+            controllers.PROGRESS_STEP = step
+        self.assertTrue(job.cancelled)
+        self.assertIsNone(job.result)
+
+    def test_dijkstra(self):
+        """
+        This test function tests the 'dijkstra(g, n)' method
+        """
+        controllers.dijkstra(graph, graph.nodes[0])
+        expected = [0, 4, 12, 19, 21, 11, 9, 8, 14]
+        for node, distance in zip(graph.nodes, expected):
+            self.assertEqual(graph.distances[node], distance)
+        self.assertIs(graph.preds[nodes[8]], connections[6])
+
+        isolated = Node('x')
+        other_graph = Graph([nodes[0], isolated], [])
+        controllers.dijkstra(other_graph, isolated)
+        self.assertEqual(other_graph.distances[isolated], 0)
+        self.assertEqual(other_graph.distances[nodes[0]], math.inf)
+
     def test_get_weight(self):
         """
         This test function tests the 'get_weight(g, n1, n2)' method
@@ -96,11 +377,439 @@ class TestControllersMethods(unittest.TestCase):
         self.assertIn(graph.nodes[1], cnnx[0].nodes)
         self.assertIn(graph.nodes[0], cnnx[1].nodes)
         self.assertIn(graph.nodes[1], cnnx[1].nodes)
+        self.assertEqual(len(cnnx), 2)
+        self.assertEqual(controllers.find_path(graph, graph.nodes[0], graph.nodes[0]), [])
+
+        node_a, node_b, isolated = Node('a'), Node('b'), Node('x')
+        other_graph = Graph([node_a, node_b, isolated], [Connection((node_a, node_b), 1)])
+        controllers.dijkstra(other_graph, node_a)
+        self.assertIsNone(controllers.find_path(other_graph, node_a, isolated))
+
+class TestBatchMethods(unittest.TestCase):
+    """
+    This class contains the tests of the batch module
+    """
+    def test_all_pairs(self):
+        """
+        This test function tests 'all_pairs' in the current process and on a pool
+        """
+        expected = [controllers.search(graph, node) for node in nodes]
+        for processes in (1, 2):
+            matrix = batch.all_pairs(graph, processes, paths=True)
+            self.assertEqual(matrix.shape, (9, 9))
+            for result in expected:
+                self.assertEqual(list(matrix.row(result.source)),
+                                 [result.distance(node) for node in nodes])
+            self.assertEqual(sum(conn.weight for conn in matrix.path(nodes[0], nodes[4])), 21)
+            self.assertEqual(matrix.path(nodes[3], nodes[3]), [])
+
+    def test_many_sources(self):
+        """
+        This test function tests 'many_sources' with unreachable nodes
+        """
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 2))
+        matrix = batch.many_sources(local_graph, [node_b, node_b])
+        self.assertEqual(matrix.sources, (node_b,))
+        self.assertEqual(matrix.distance(node_b, node_a), 2)
+        self.assertEqual(matrix.distance(node_b, node_c), math.inf)
+        with self.assertRaises(ValueError):
+            matrix.path(node_b, node_a)
+
+
+class TestPreprocessingMethods(unittest.TestCase):
+    """
+    This class contains the tests of the preprocessing module
+    """
+    def test_contraction_hierarchy(self):
+        """
+        This test function tests the 'ContractionHierarchy' queries against 'search'
+        """
+        hierarchy = preprocessing.ContractionHierarchy(graph)
+        for start in nodes:
+            result = controllers.search(graph, start)
+            for dest in nodes:
+                distance, path = hierarchy.route(start, dest)
+                self.assertEqual(distance, result.distance(dest))
+                self.assertEqual(sum(conn.weight for conn in path), distance)
+                node = dest
+                for conn in path:
+                    node = conn.other_node(node)
+                self.assertIs(node, start)
+
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 2))
+        local_graph.precomputed = preprocessing.ContractionHierarchy(local_graph)
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_c), (math.inf, None))
+        # the hierarchy is left aside once the graph is edited
+        local_graph.add_connection(Connection((node_b, node_c), 3))
+        self.assertFalse(local_graph.precomputed.covers(local_graph))
+        self.assertEqual(controllers.shortest_path(local_graph, node_a, node_c)[0], 5)
+        local_graph.precomputed.build(local_graph)
+        self.assertEqual(controllers.precomputed_route(local_graph, node_c, node_a)[0], 5)
+
+
+    def test_landmarks(self):
+        """
+        This test function tests the 'Landmarks' A* queries against 'search'
+        """
+        for selection in preprocessing.Landmarks.SELECTIONS:
+            landmarks = preprocessing.Landmarks(graph, 3, selection)
+            self.assertTrue(landmarks.landmarks)
+            for start in nodes:
+                result = controllers.search(graph, start)
+                for dest in nodes:
+                    distance, path = landmarks.route(start, dest)
+                    self.assertEqual(distance, result.distance(dest))
+                    self.assertEqual(sum(conn.weight for conn in path), distance)
+
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 2))
+        local_graph.precomputed = preprocessing.Landmarks(local_graph, 2)
+        self.assertEqual(controllers.shortest_path(local_graph, node_c, node_a), (math.inf, None))
+        # the tables are rebuilt on the next query after an edit
+        local_graph.add_connection(Connection((node_b, node_c), 3))
+        self.assertEqual(controllers.precomputed_route(local_graph, node_c, node_a)[0], 5)
+        self.assertFalse(local_graph.precomputed.snapshot.is_stale(local_graph))
+        with self.assertRaises(ValueError):
+            preprocessing.Landmarks(local_graph, selection='random')
+
+
+class TestStorageMethods(unittest.TestCase):
+    """
+    This class contains the tests of the storage module
+    """
+    def test_distance_store(self):
+        """
+        This test function tests saving a distance matrix and answering queries from it
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'distances.bin')
+            storage.save_distances(path, graph, [nodes[0], nodes[3]], processes=1)
+            with storage.DistanceStore(path, graph) as store:
+                self.assertTrue(store.covers(graph, nodes[0], paths=True))
+                self.assertFalse(store.covers(graph, nodes[1]))
+                self.assertEqual(store.distance(nodes[0], nodes[4]), 21)
+                self.assertEqual(store.distance(nodes[3], nodes[0]), 19)
+
+                graph.precomputed = store
+                try:
+                    controllers.init(graph, nodes[5])
+                    path_conns = controllers.find_path(graph, nodes[0], nodes[4])
+                    self.assertEqual(sum(conn.weight for conn in path_conns), 21)
+                    self.assertEqual(controllers.find_min_distance(graph, nodes[3], nodes[8]),
+                                     controllers.search(graph, nodes[3]).distance(nodes[8]))
+                finally:
+                    graph.precomputed = None
+
+            size = os.path.getsize(path)
+            for cut in (8, 3):
+                with open(path, 'r+b') as file:
+                    file.truncate(size - cut)
+                with self.assertRaises(ValueError):
+                    storage.DistanceStore(path, graph)
+            with open(path, 'r+b') as file:
+                file.truncate(size)
+                # first source index, right after the 64 bytes header
+                file.seek(64)
+                file.write(struct.pack('=q', len(nodes)))
+            with self.assertRaises(ValueError):
+                storage.DistanceStore(path, graph)
+
+            other = Graph([Node('0'), Node('1')])
+            with self.assertRaises(ValueError):
+                storage.DistanceStore(path, other)
+
+            storage.save_distances(path, other, next_hops=False)
+            with storage.DistanceStore(path, other) as store:
+                self.assertEqual(store.distance(other.nodes[0], other.nodes[1]), math.inf)
+                self.assertFalse(store.covers(other, other.nodes[0], paths=True))
+                other.add_node(Node('2'))
+                self.assertFalse(store.covers(other, other.nodes[0]))
+
+
+    def test_graph_file(self):
+        """
+        This test function tests saving and loading graphs
+        """
+        node_a, node_b, node_c = Node('a'), Node('é', (10, 20.5)), Node('', (3, 4))
+        node_b.color = (1, 2, 3)
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_b), 2))
+        local_graph.add_connection(Connection((node_c, node_b), 0.5, (9, 9, 9)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.graph')
+            storage.save_graph(path, local_graph)
+            with storage.GraphFile(path) as graph_file:
+                self.assertEqual(len(graph_file), 3)
+                self.assertEqual(graph_file.connection_count, 2)
+                self.assertEqual(graph_file.node(1).text, 'é')
+                loaded = graph_file.load()
+                self.assertIs(loaded.nodes[1], graph_file.node(1))
+
+            self.assertEqual([(node.node_id, node.text, node.pos, node.color)
+                              for node in loaded.nodes],
+                             [(node.node_id, node.text, node.pos, node.color)
+                              for node in local_graph.nodes])
+            self.assertEqual([(conn.weight, type(conn.weight), conn.color)
+                              for conn in loaded.connections],
+                             [(2, int, (0, 0, 0)), (0.5, float, (9, 9, 9))])
+            self.assertEqual(loaded.freeze().fingerprint(), local_graph.freeze().fingerprint())
+            self.assertEqual(controllers.shortest_path(loaded, loaded.nodes[0],
+                                                       loaded.nodes[2])[0], 2.5)
+
+            version = local_graph.version
+            local_graph.replace(storage.load_graph(path))
+            self.assertGreater(local_graph.version, version)
+            self.assertEqual(len(local_graph.nodes), 3)
+
+            with open(path, 'r+b') as file:
+                # second node of the first connection (header 48, node records 40 bytes)
+                file.seek(48 + 3 * 40 + 8)
+                file.write(struct.pack('=q', 3))
+            with self.assertRaises(ValueError):
+                storage.load_graph(path)
+            with open(path, 'r+b') as file:
+                file.seek(48 + 3 * 40 + 8)
+                file.write(struct.pack('=q', -1))
+            with self.assertRaises(ValueError):
+                storage.load_graph(path)
+            with open(path, 'r+b') as file:
+                # text size of the first node
+                file.seek(48 + 28)
+                file.write(struct.pack('=I', 100))
+            with storage.GraphFile(path) as graph_file:
+                self.assertEqual(graph_file.node(1).text, 'é')
+                with self.assertRaises(ValueError):
+                    graph_file.node(0)
+
+            with open(path, 'r+b') as file:
+                file.write(b'NOTAGRPH')
+            with self.assertRaises(ValueError):
+                storage.load_graph(path)
+
 
 class TestModelsMethods(unittest.TestCase):
     """
     This class is responsible for testing the different 'models.py' methods
     """
+    def test_connection_between(self):
+        """
+        This test function tests the 'Graph.connection_between(n1, n2)' method
+        """
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        conn = Connection((node_a, node_b), 3)
+        local_graph = Graph([node_a, node_b, node_c], [conn])
+        self.assertIs(local_graph.connection_between(node_a, node_b), conn)
+        self.assertIs(local_graph.connection_between(node_b, node_a), conn)
+        self.assertIsNone(local_graph.connection_between(node_a, node_c))
+
+        local_graph.set_weight(conn, 5)
+        self.assertEqual(controllers.get_weight(local_graph, node_b, node_a), 5)
+        local_graph.remove_connection(conn)
+        self.assertIsNone(local_graph.connection_between(node_a, node_b))
+        self.assertEqual(controllers.get_weight(local_graph, node_a, node_b), -1)
+
+    def test_compact_layout(self):
+        """
+        This test function tests the slots and packed flags of nodes and connections
+        """
+        node_a, node_b = Node('a'), Node('b')
+        conn = Connection((node_a, node_b), 1)
+        self.assertFalse(hasattr(node_a, '__dict__') or hasattr(conn, '__dict__'))
+        self.assertIs(node_a.color, Node.DEFAULT_COLOR)
+        self.assertEqual(node_a.radius, 20)
+
+        node_a.hovered = True
+        node_a.selected = True
+        node_a.hovered = False
+        self.assertEqual((node_a.hovered, node_a.selected), (False, True))
+        conn.enable_highlight()
+        self.assertTrue(conn.is_highlighted)
+        conn.disable_highlight()
+        self.assertFalse(conn.is_highlighted)
+
+        copied = copy.copy(node_a)
+        copied.text = 'c'
+        self.assertEqual((node_a.text, copied.selected), ('a', True))
+
+    def test_remove_node(self):
+        """
+        This test function tests removing nodes and parallel connections
+        """
+        local_nodes = [Node(str(i)) for i in range(4)]
+        local_graph = Graph(local_nodes)
+        first = Connection((local_nodes[0], local_nodes[1]), 3)
+        second = Connection((local_nodes[1], local_nodes[0]), 2)
+        for conn in (first, second, Connection((local_nodes[1], local_nodes[2]), 1),
+                     Connection((local_nodes[2], local_nodes[3]), 1)):
+            local_graph.add_connection(conn)
+
+        neighbors = local_nodes[0].neighbors
+        self.assertEqual(len(neighbors), 2)
+        self.assertEqual(list(neighbors), list(neighbors))
+        self.assertIn((local_nodes[1], second), neighbors)
+        self.assertIn(second, local_nodes[0].connections)
+        self.assertNotIn(second, local_nodes[3].connections)
+
+        local_graph.remove_connection(second)
+        self.assertIs(local_graph.connection_between(local_nodes[0], local_nodes[1]), first)
+        self.assertEqual(list(local_nodes[0].connections), [first])
+        self.assertEqual(len(neighbors), 1)
+        # the parallel connection takes over when the indexed one is removed
+        local_nodes[0].add_neighbor((local_nodes[1], second))
+        local_nodes[1].add_neighbor((local_nodes[0], second))
+        local_graph.add_connection(second)
+        local_graph.remove_connection(first)
+        self.assertIs(local_graph.connection_between(local_nodes[1], local_nodes[0]), second)
+
+        # a loop is a single neighbor of its node
+        loop = Connection((local_nodes[3], local_nodes[3]), 1)
+        self.assertEqual(list(local_nodes[3].connections)[-1:], [loop])
+        self.assertEqual(len(local_nodes[3].connections), 2)
+        local_graph.add_connection(loop)
+        local_graph.remove_connection(loop)
+        self.assertEqual(len(local_nodes[3].connections), 1)
+
+        removed = local_graph.remove_node(local_nodes[1])
+        self.assertEqual(len(removed), 2)
+        self.assertEqual(local_graph.nodes, [local_nodes[0], local_nodes[2], local_nodes[3]])
+        self.assertIs(local_graph.nodes[-1], local_nodes[3])
+        self.assertEqual(len(local_graph.connections), 1)
+        self.assertEqual(list(local_nodes[0].neighbors), [])
+        with self.assertRaises(ValueError):
+            local_graph.nodes.remove(local_nodes[1])
+
+    def test_graph_version(self):
+        """
+        This test function tests that the graph edits bump 'Graph.version'
+        """
+        local_graph = Graph()
+        node_a, node_b = Node('a'), Node('b')
+        versions = [local_graph.version]
+        local_graph.add_node(node_a)
+        local_graph.add_node(node_b)
+        versions.append(local_graph.version)
+        conn = Connection((node_a, node_b), 1)
+        local_graph.add_connection(conn)
+        versions.append(local_graph.version)
+        local_graph.set_weight(conn, 2)
+        versions.append(local_graph.version)
+        local_graph.remove_node(node_a)
+        versions.append(local_graph.version)
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(local_graph.connections, [])
+        self.assertEqual(list(node_b.neighbors), [])
+
+    def test_freeze(self):
+        """
+        This test function tests the 'Graph.freeze()' snapshot
+        """
+        node_a, node_b, node_c = Node('a'), Node('b'), Node('c')
+        local_graph = Graph([node_a, node_b, node_c])
+        local_graph.add_connection(Connection((node_a, node_c), 7))
+        snapshot = local_graph.freeze()
+        self.assertEqual(list(snapshot.offsets), [0, 1, 1, 2])
+        self.assertEqual(list(snapshot.targets), [2, 0])
+        self.assertEqual(list(snapshot.weights), [7, 7])
+        self.assertEqual(list(snapshot.node_ids), [node.node_id for node in local_graph.nodes])
+
+        local_graph.set_weight(local_graph.connections[0], 3)
+        self.assertTrue(snapshot.is_stale(local_graph))
+        self.assertIsNot(local_graph.freeze(), snapshot)
+
+    def test_components(self):
+        """
+        This test function tests the 'ComponentIndex' of a graph
+        """
+        local_nodes = [Node(str(i)) for i in range(4)]
+        local_graph = Graph(list(local_nodes))
+        self.assertFalse(local_graph.connected(local_nodes[0], local_nodes[1]))
+        self.assertEqual(len(local_graph.components), 4)
+
+        conn = Connection((local_nodes[0], local_nodes[1]), 1)
+        local_graph.add_connection(conn)
+        local_graph.add_connection(Connection((local_nodes[1], local_nodes[2]), 1))
+        self.assertFalse(local_graph.components.stale)
+        self.assertTrue(local_graph.connected(local_nodes[0], local_nodes[2]))
+        self.assertEqual(controllers.shortest_path(local_graph, local_nodes[0], local_nodes[3]),
+                         (math.inf, None))
+
+        # a removal marks the index stale until the next query, find_path does not
+        # rebuild it
+        controllers.dijkstra(local_graph, local_nodes[0])
+        local_graph.remove_connection(conn)
+        controllers.repair_increase(local_graph, conn)
+        self.assertIsNone(controllers.find_path(local_graph, local_nodes[0], local_nodes[2]))
+        self.assertTrue(local_graph.components.stale)
+        self.assertFalse(local_graph.connected(local_nodes[0], local_nodes[2]))
+        self.assertEqual(len(local_graph.components), 3)
+        node = Node('4')
+        local_graph.add_node(node)
+        self.assertFalse(local_graph.components.stale)
+        self.assertEqual(len(local_graph.components), 4)
+
+        # links made behind the back of the graph are noticed on the next query
+        local_graph.connections.append(Connection((local_nodes[2], node), 2))
+        self.assertTrue(local_graph.connected(local_nodes[1], node))
+        self.assertEqual(controllers.find_min_distance(local_graph, local_nodes[1], node), 3)
+        Connection((local_nodes[3], node), 1)
+        local_graph.add_connection(Connection((local_nodes[0], local_nodes[3]), 1))
+        self.assertTrue(local_graph.connected(local_nodes[3], local_nodes[2]))
+        self.assertEqual(controllers.shortest_path(local_graph, local_nodes[0],
+                                                   local_nodes[2]).distance, 4)
+
+    def test_spatial_grid(self):
+        """
+        This test function tests the node hit-testing through 'Graph.node_at(pos)'
+        """
+        local_graph = Graph()
+        for _ in range(200):
+            local_graph.add_node(Node('?', random_position()))
+        moved = local_graph.nodes[0]
+        local_graph.move_node(moved, (1000, 1000))
+        local_graph.remove_node(local_graph.nodes[1])
+
+        for _ in range(200):
+            pos = random_position()
+            expected = None
+            for node in local_graph.nodes:
+                if abs(pos[0] - node.pos[0]) <= node.radius and \
+                        abs(pos[1] - node.pos[1]) <= node.radius:
+                    expected = node
+                    break
+            self.assertIs(local_graph.node_at(pos), expected)
+        self.assertIs(local_graph.node_at((1010, 990)), moved)
+        self.assertEqual(len(local_graph.grid), 199)
+
+    def test_spatial_grid_connections(self):
+        """
+        This test function tests the connection lookups of the spatial grid
+        """
+        local_nodes = [Node('?', random_position((3000, 3000))) for _ in range(100)]
+        local_graph = Graph(local_nodes)
+        for _ in range(300):
+            local_graph.add_connection(Connection(random.sample(local_nodes, 2)))
+        local_graph.move_node(local_nodes[0], (5000, -200))
+        local_graph.remove_node(local_nodes[1])
+        local_graph.remove_connection(local_graph.connections[0])
+
+        for _ in range(50):
+            left, top = random_position((3000, 3000))
+            rect = (left, top, left + random.randint(0, 800), top + random.randint(0, 800))
+            expected = {conn for conn in local_graph.connections
+                        if min(n.pos[0] for n in conn.nodes) <= rect[2] and
+                        max(n.pos[0] for n in conn.nodes) >= rect[0] and
+                        min(n.pos[1] for n in conn.nodes) <= rect[3] and
+                        max(n.pos[1] for n in conn.nodes) >= rect[1]}
+            found = local_graph.grid.connections_in_rect(*rect)
+            self.assertLessEqual(expected, found)
+            self.assertLessEqual(found, set(local_graph.connections))
+
     def test_random_position(self):
         """
         This test function tests the 'random_position()' method
@@ -122,5 +831,158 @@ class TestModelsMethods(unittest.TestCase):
             self.assertIn(color_g, color_range)
             self.assertIn(color_b, color_range)
 
+class DragTool(Tool):
+    """
+    Tool moving a single node around, like the 'views.MoveTool'
+    """
+    def __init__(self):
+        super().__init__()
+        self.node = None
+
+    @property
+    def active_nodes(self):
+        return () if self.node is None else (self.node,)
+
+
+class TestRendererMethods(unittest.TestCase):
+    """
+    This class is responsible for testing the different 'renderer.py' methods
+    """
+    def setUp(self):
+        pygame.font.init()
+        self.font = pygame.font.SysFont(None, 25)
+
+    def full_redraw(self, local_graph):
+        """
+        This method draws the whole graph from scratch on a new surface
+        """
+        surface = pygame.Surface((200, 200))
+        surface.fill((240, 240, 240))
+        for connection in local_graph.connections:
+            connection.render(surface, self.font)
+        for node in local_graph.nodes:
+            node.render(surface, self.font)
+        return pygame.image.tostring(surface, 'RGB')
+
+    def test_label_cache(self):
+        """
+        This test function tests the 'LabelCache' class
+        """
+        labels = LabelCache(max_entries=2)
+        label = labels.get(self.font, 'a')
+        self.assertIs(labels.get(self.font, 'a'), label)
+        self.assertIsNot(labels.get(self.font, 'a', (255, 0, 0)), label)
+        labels.get(self.font, 'b')
+        self.assertEqual(len(labels), 2)
+        # 'a' in black was the least recently used label
+        self.assertIsNot(labels.get(self.font, 'a'), label)
+        labels.evict('a')
+        self.assertEqual(len(labels), 1)
+
+    def test_camera(self):
+        """
+        This test function tests the 'Camera' class
+        """
+        camera = Camera()
+        camera.zoom_at((100, 50), 2)
+        self.assertEqual(camera.to_screen((100, 50)), (100, 50))
+        self.assertEqual(camera.to_screen((110, 60)), (120, 70))
+        camera.pan((20, 0))
+        self.assertEqual(camera.to_world((120, 50)), (100, 50))
+        self.assertEqual(camera.viewport((200, 100)), (40, 25, 140, 75))
+
+    def test_render_culling(self):
+        """
+        This test function tests the viewport culling and the level of detail switch
+        """
+        drawn = []
+
+        class SpyNode(Node):
+            """
+            Node recording its renderings
+            """
+            def render(self, screen, font, hovered=None, camera=None):
+                drawn.append(self)
+                return super().render(screen, font, hovered, camera)
+
+        near, far = SpyNode('n', (50, 50)), SpyNode('f', (5000, 5000))
+        local_graph = Graph([near, far])
+        screen = pygame.Surface((200, 200))
+        renderer = Renderer(screen, self.font, (240, 240, 240))
+        renderer.render(local_graph, DragTool())
+        self.assertEqual(drawn, [near])
+        self.assertTrue(renderer.camera.detailed)
+
+        renderer.lod_threshold = 0
+        renderer.camera.pan((10, 10))
+        renderer.render(local_graph, DragTool())
+        self.assertFalse(renderer.camera.detailed)
+
+    def test_render_order(self):
+        """
+        This test function tests that connections are drawn in the order of the graph, \
+            the highlighted ones last
+        """
+        drawn = []
+
+        class SpyConnection(Connection):
+            """
+            Connection recording its renderings
+            """
+            def render(self, screen, font, camera=None):
+                drawn.append(self)
+                return super().render(screen, font, camera)
+
+        rnd = random.Random(3)
+        local_nodes = [Node(str(i), (rnd.randint(0, 400), rnd.randint(0, 400)))
+                       for i in range(30)]
+        local_graph = Graph(local_nodes)
+        for _ in range(60):
+            local_graph.add_connection(SpyConnection(tuple(rnd.sample(local_nodes, 2)), 1))
+        renderer = Renderer(pygame.Surface((200, 200)), self.font, (240, 240, 240))
+        for offset in ((0, 0), (-37, -5), (-90, -120)):
+            drawn.clear()
+            renderer.camera.pan(offset)
+            renderer.render(local_graph, DragTool())
+            self.assertTrue(drawn)
+            self.assertEqual(drawn, sorted(drawn, key=local_graph.connections.index))
+
+        highlighted = drawn[0]
+        highlighted.enable_highlight()
+        local_graph.restyle()
+        drawn.clear()
+        renderer.render(local_graph, DragTool())
+        self.assertIs(drawn[-1], highlighted)
+
+    def test_render(self):
+        """
+        This test function tests that the 'Renderer.render()' frames match a full redraw
+        """
+        node_a, node_b = Node('a', (40, 40)), Node('b', (150, 60))
+        local_graph = Graph([node_a, node_b])
+        local_graph.add_connection(Connection((node_a, node_b), 3))
+        screen = pygame.Surface((200, 200))
+        renderer = Renderer(screen, self.font, (240, 240, 240))
+        tool = DragTool()
+
+        self.assertEqual(renderer.render(local_graph, tool), [screen.get_rect()])
+        self.assertEqual(renderer.render(local_graph, tool), [])
+        self.assertEqual(pygame.image.tostring(screen, 'RGB'), self.full_redraw(local_graph))
+
+        tool.node = node_b
+        renderer.render(local_graph, tool)
+        for pos in [(140, 100), (120, 150), (100, 160)]:
+            local_graph.move_node(node_b, pos)
+            dirty = renderer.render(local_graph, tool)
+            self.assertNotIn(screen.get_rect(), dirty)
+            self.assertEqual(pygame.image.tostring(screen, 'RGB'), self.full_redraw(local_graph))
+
+        node_a.hovered = True
+        self.assertTrue(renderer.render(local_graph, tool, {node_a}))
+        node_a.hovered = False
+        renderer.render(local_graph, tool, {node_a})
+        self.assertEqual(pygame.image.tostring(screen, 'RGB'), self.full_redraw(local_graph))
+
+
 if __name__ == '__main__':
     unittest.main()
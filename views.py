@@ -3,36 +3,90 @@ This is the views module
 """
 
 import copy
-from math import floor
+from math import floor, inf
 from tkinter import (HORIZONTAL, Canvas, PhotoImage, IntVar, StringVar, Tk,
-                     Toplevel, colorchooser, messagebox)
+                     Toplevel, colorchooser, filedialog, messagebox)
 from tkinter.ttk import (Button, Entry, Frame, Label, Separator, Radiobutton)
 
-from models import Node, Tool, Graph, Connection, draw
+from models import LABELS, Node, Tool, Graph, Connection, draw
+from storage import load_graph, save_graph
 
-from controllers import dijkstra, find_path
+from controllers import (ShortestPathCache, ShortestPathJob, ShortestPaths, find_path,
+                         load_result, precomputed_route, repair_decrease,
+                         repair_removed_node, repair_weight_change, snapshot_path,
+                         tree_from_snapshot)
 
 
-def mouse_on_a_node(pos, nodes) -> Node:
+def mouse_on_a_node(pos, graph) -> Node:
     """
     This method returns the node that the mouse is positioned on.
     """
-    for node in nodes:
-        if pos[0] >= node.pos[0]-node.radius and pos[0] <= node.pos[0]+node.radius and \
-                pos[1] >= node.pos[1]-node.radius and pos[1] <= node.pos[1]+node.radius:
-            return node
-    return None
+    return graph.node_at(pos)
+
+
+def highlight_route(graph, start_node, dest_node, path):
+    """
+    This method highlights the given path as the route between start_node and dest_node \
+        (a None path clears the route).
+    """
+    if graph.route is not None:
+        for conn in graph.route[2]:
+            conn.disable_highlight()
+    graph.route = None if path is None else (start_node, dest_node, path)
+    for conn in path or ():
+        conn.enable_highlight()
+    graph.restyle()
+
+
+def refresh_route(graph, path_cache=None) -> bool:
+    """
+    This method highlights the route again after the graph was edited, when it can be \
+        done without a search: from the shortest-path tree of the graph repaired in \
+        place (then stored in the cache), from the precomputed paths or from a cached \
+        tree, which is loaded onto the graph. It returns False when the route has to \
+        be computed again, see ToolBar.refresh_route.
+    """
+    if graph.route is None:
+        return True
+    start_node, dest_node, _ = graph.route
+    if graph.source is start_node:
+        path = find_path(graph, start_node, dest_node)
+        if path_cache is not None:
+            # a complete tree has settled exactly the nodes it reached
+            distances = {node: distance for node, distance in graph.distances.items()
+                         if distance < inf}
+            path_cache.put(start_node, graph.version, ShortestPaths(
+                start_node, distances, dict(graph.preds), len(distances),
+                version=graph.version))
+    elif not graph.connected(start_node, dest_node):
+        path = None
+    else:
+        route = precomputed_route(graph, start_node, dest_node)
+        result = None if path_cache is None else path_cache.get(start_node, graph.version)
+        if route is not None:
+            path = route.path
+        elif result is not None:
+            load_result(graph, result)
+            path = result.path(dest_node)
+        else:
+            return False
+    highlight_route(graph, start_node, dest_node, path)
+    return True
 
 
 class ToolBar(Tk):
     """
     The toolbar class
     """
+    FILE_TYPES = (('Graph files', '.graph'), ('All files', '*'))
+
     def __init__(self, graph=None):
         super().__init__()
         self.title('Toolbar')
         self.tool = Tool()
         self.graph = graph
+        self.path_cache = ShortestPathCache()
+        self._route_job = None
 
         self.tools = []
 
@@ -51,20 +105,95 @@ class ToolBar(Tk):
             tool.button.grid(row=0, column=i)
         Button(self, text='Find Shortest Path', command=self._open_shorest_path_win).grid(
             row=0, column=len(self.tools), sticky='nsew')
+        Button(self, text='Save', command=self._save).grid(
+            row=0, column=len(self.tools) + 1, sticky='nsew')
+        Button(self, text='Open', command=self._open).grid(
+            row=0, column=len(self.tools) + 2, sticky='nsew')
+
+    def refresh_route(self):
+        """
+        This method highlights the route again after the graph was edited. When no \
+            tree of the route is at hand, its start node's tree is computed on a worker \
+            thread like in DijkstraFrame, the window staying responsive meanwhile.
+        """
+        if self._route_job is not None:
+            self._route_job.cancel()
+            self._route_job = None
+        if refresh_route(self.graph, self.path_cache):
+            return
+        snapshot = self.graph.freeze()
+        self._route_job = ShortestPathJob(snapshot, snapshot.index_of(self.graph.route[0]))
+        self._route_job.start()
+        self.after(DijkstraFrame.POLL_INTERVAL, self._poll_route)
+
+    def _poll_route(self):
+        job = self._route_job
+        if job is None:
+            return
+        if job.is_alive():
+            self.after(DijkstraFrame.POLL_INTERVAL, self._poll_route)
+            return
+
+        self._route_job = None
+        if job.error is not None:
+            messagebox.showerror('Error calculating path', str(job.error))
+            return
+        # the route may have been cleared or computed again from another node meanwhile
+        if job.cancelled or self.graph.route is None or \
+                self.graph.route[0] is not job.snapshot.nodes[job.source]:
+            return
+        if job.snapshot.is_stale(self.graph):
+            self.refresh_route()
+            return
+        start_node, dest_node, _ = self.graph.route
+        result = tree_from_snapshot(job.snapshot, job.source, *job.result)
+        load_result(self.graph, result)
+        self.path_cache.put(start_node, self.graph.version, result)
+        highlight_route(self.graph, start_node, dest_node, result.path(dest_node))
 
     def _open_shorest_path_win(self):
-        DijkstraFrame(self.master, self.graph)
+        DijkstraFrame(self, self.graph, self.path_cache)
+
+    def _save(self):
+        path = filedialog.asksaveasfilename(
+            parent=self, defaultextension=ToolBar.FILE_TYPES[0][1], filetypes=ToolBar.FILE_TYPES)
+        if not path:
+            return
+        try:
+            save_graph(path, self.graph)
+        except OSError as error:
+            messagebox.showerror('Error saving the graph', str(error))
+
+    def _open(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=ToolBar.FILE_TYPES)
+        if not path:
+            return
+        try:
+            # the whole graph is built here, the window needs every node and connection
+            graph = load_graph(path)
+        except (OSError, ValueError) as error:
+            messagebox.showerror('Error opening the graph', str(error))
+            return
+        self.graph.replace(graph)
+        self.path_cache.clear()
 
 
 class DijkstraFrame(Toplevel):
     """Dijkstra Frame class"""
-    def __init__(self, master=None, graph=None):
+    # delay between two checks of a running computation
+    POLL_INTERVAL = 50  # ms
+
+    def __init__(self, master=None, graph=None, path_cache=None):
         super().__init__(master=master)
         self.graph = graph
+        self.path_cache = path_cache
         self.title('Dijkstra - Find the shortest path')
 
         self._f_node_var = IntVar()
         self._l_node_var = IntVar()
+        self._status_var = StringVar()
+        self._job = None
+        self._query = None
         self._init_ui()
 
     def _init_ui(self):
@@ -88,16 +217,33 @@ class DijkstraFrame(Toplevel):
         Separator(self, orient=HORIZONTAL).grid(
             row=length*2+4, column=0, columnspan=2, sticky='nsew')
 
-        Button(self, text='Cancel', command=self.destroy).grid(
+        Button(self, text='Cancel', command=self._cancel).grid(
             row=length*2+5, column=0)
         Button(self, text='Calculate', command=self._calculate).grid(
             row=length*2+5, column=1)
         Button(self, text='Reset', command=self._reset).grid(
             row=length*2+6, column=1)
+        Label(self, textvariable=self._status_var).grid(
+            row=length*2+7, column=0, columnspan=2, sticky='w')
 
     def _reset(self):
         for conn in self.graph.connections:
             conn.disable_highlight()
+        self.graph.route = None
+        self.graph.restyle()
+
+    def _cancel(self):
+        # the first click stops a running computation, the next one closes the window
+        if self._job is not None:
+            self._job.cancel()
+        else:
+            self.destroy()
+
+    def destroy(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+        return super().destroy()
 
     def _calculate(self):
         f_node_id = int(self._f_node_var.get())
@@ -115,23 +261,89 @@ class DijkstraFrame(Toplevel):
                     l_node = node
                 if f_node and l_node:
                     break
-            dijkstra(self.graph, f_node)
 
-            # highlight path
-            cnx = find_path(self.graph, f_node, l_node, [])
-            for conn in self.graph.connections:
-                conn.disable_highlight()
-            for conn in cnx:
-                conn.enable_highlight()
-            # ?new feature: print the distances to other nodes in a table graphically
+            if not self.graph.connected(f_node, l_node):
+                self._show_path(f_node, l_node, None)
+                return
+            route = precomputed_route(self.graph, f_node, l_node)
+            if route is not None:
+                # no tree goes with this route: edits must not repair the tree of
+                # another start node
+                self.graph.source = None
+                self._show_path(f_node, l_node, route[1])
+                return
+            result = None
+            if self.path_cache is not None:
+                result = self.path_cache.get(f_node, self.graph.version)
+            if result is not None:
+                # the cached tree is the one edits repair from now on
+                load_result(self.graph, result)
+                self._show_path(f_node, l_node, result.path(l_node))
+                return
+
+            # the search runs on a worker thread, see _poll. With a cache, the whole
+            # tree is computed so that it can be cached and repaired after edits;
+            # otherwise the search stops as soon as l_node is settled
+            if self._job is not None:
+                self._job.cancel()
+            snapshot = self.graph.freeze()
+            targets = None if self.path_cache is not None else (snapshot.index_of(l_node),)
+            self._job = ShortestPathJob(snapshot, snapshot.index_of(f_node), targets)
+            self._query = (f_node, l_node)
+            self._status_var.set('Calculating... 0%')
+            self._job.start()
+            self.after(DijkstraFrame.POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        job = self._job
+        if job is None:
+            return
+        if job.is_alive():
+            self._status_var.set(f'Calculating... {job.progress:.0%}')
+            self.after(DijkstraFrame.POLL_INTERVAL, self._poll)
+            return
+
+        self._job = None
+        if job.cancelled:
+            self._status_var.set('Calculation cancelled')
+        elif job.error is not None:
+            self._status_var.set('')
+            messagebox.showerror('Error calculating path', str(job.error))
+        elif job.snapshot.is_stale(self.graph):
+            self._status_var.set('The graph changed meanwhile, calculate again')
+        elif job.targets is not None:
+            self._status_var.set('')
+            f_node, l_node = self._query
+            self._show_path(f_node, l_node,
+                            snapshot_path(job.snapshot, job.result[1], f_node, l_node))
+        else:
+            self._status_var.set('')
+            f_node, l_node = self._query
+            result = tree_from_snapshot(job.snapshot, job.source, *job.result)
+            # keep the tree on the graph so that edits can repair it in place
+            load_result(self.graph, result)
+            if self.path_cache is not None:
+                self.path_cache.put(f_node, self.graph.version, result)
+            self._show_path(f_node, l_node, result.path(l_node))
+
+    def _show_path(self, f_node, l_node, cnx):
+        # highlight path
+        if cnx is None:
+            messagebox.showinfo(
+                'No path', f'{l_node} can not be reached from {f_node}')
+            return
+        highlight_route(self.graph, f_node, l_node, cnx)
+        # ?new feature: print the distances to other nodes in a table graphically
 
 class NodeConfigurationFrame(Toplevel):
     """Node configuration frame class"""
-    def __init__(self, master: Frame = None, graph: Graph = None, node: Node = None):
+    def __init__(self, master: Frame = None, graph: Graph = None, node: Node = None,
+                 path_cache: ShortestPathCache = None):
         super().__init__(master=master)
 
         self.graph = graph
         self.node = node
+        self.path_cache = path_cache
         self._temp_node = copy.copy(self.node)
         self._text_var = StringVar(value=self.node.text)
 
@@ -161,18 +373,18 @@ class NodeConfigurationFrame(Toplevel):
 
         for i, (neighbor_node, connection) in enumerate(self.node.neighbors):
             NodeConnectionConfigRow(
-                self, neighbor_node, connection).grid(row=5+i, column=0)
+                self, neighbor_node, connection, self.graph).grid(row=5+i, column=0)
 
         Separator(self, orient=HORIZONTAL).grid(
-            row=5+len(self.node.neighbors), column=0, columnspan=2, sticky='nsew')
+            row=5+len(self.node.connections), column=0, columnspan=2, sticky='nsew')
         self.canvas = Canvas(self, width=250, height=100)
         self._draw_node(self._temp_node)
-        self.canvas.grid(row=6+len(self.node.neighbors),
+        self.canvas.grid(row=6+len(self.node.connections),
                          column=0, columnspan=2, sticky='nsew')
         Button(self, text='Cancel', command=self.destroy).grid(
-            row=7+len(self.node.neighbors), column=0)
+            row=7+len(self.node.connections), column=0)
         Button(self, text='Save', command=self._save_node).grid(
-            row=7+len(self.node.neighbors), column=1)
+            row=7+len(self.node.connections), column=1)
 
     def _get_color(self):
         # ((r, g, b), '#hex')
@@ -181,9 +393,12 @@ class NodeConfigurationFrame(Toplevel):
 
     def destroy(self):
         self.node.selected = False
+        self.graph.restyle()
         return super().destroy()
 
     def _save_node(self):
+        if self.node.text != self._temp_node.text:
+            LABELS.evict(self.node.text)
         self.node.text = self._temp_node.text
         self.node.color = (
             floor(self._color[0][0]),
@@ -201,10 +416,11 @@ class NodeConfigurationFrame(Toplevel):
 
 class NodeConnectionConfigRow(Frame):
     """Node connection config row class"""
-    def __init__(self, master=None, node=None, connection=None):
+    def __init__(self, master=None, node=None, connection=None, graph=None):
         super().__init__(master=master)
         self.node = node
         self.connection = connection
+        self.graph = graph
         self._weight_text = StringVar(value='0')
 
         self._init_ui()
@@ -218,7 +434,11 @@ class NodeConnectionConfigRow(Frame):
     def _save_connection_width(self):
         try:
             weight = int(self._weight_text.get())
-            self.connection.weight = weight
+            old_weight = self.connection.weight
+            self.graph.set_weight(self.connection, weight)
+            repair_weight_change(self.graph, self.connection, old_weight)
+            # the toolbar, master of the configuration frame
+            self.master.master.refresh_route()
         except TypeError as err:
             print(err)
 
@@ -242,12 +462,13 @@ class MoveTool(Tool):
         self.master.tool = self
 
     def handle_mouse_down(self, event, double_click=False):
-        self._selected_node = mouse_on_a_node(event.pos, self.graph.nodes)
+        self._selected_node = mouse_on_a_node(event.pos, self.graph)
 
         if double_click and self._selected_node:
             self._selected_node.selected = True
+            self.graph.restyle()
             config_frame = NodeConfigurationFrame(
-                self.master, self.graph, self._selected_node)
+                self.master, self.graph, self._selected_node, self.master.path_cache)
             config_frame.geometry('250x250+600+600')
 
     def handle_mouse_up(self, event):
@@ -255,7 +476,13 @@ class MoveTool(Tool):
 
     def handle_mouse_move(self, event):
         if self._selected_node is not None:
-            self._selected_node.pos = event.pos
+            self.graph.move_node(self._selected_node, event.pos)
+
+    @property
+    def active_nodes(self):
+        if self._selected_node is None:
+            return ()
+        return (self._selected_node,)
 
 
 class AddNodeTool(Tool):
@@ -276,9 +503,9 @@ class AddNodeTool(Tool):
 
     def handle_mouse_down(self, event, double_click=False):
         if event.button == 1:
-            if mouse_on_a_node(event.pos, self.graph.nodes) is None:
+            if mouse_on_a_node(event.pos, self.graph) is None:
                 node = Node(text='?', pos=event.pos)
-                self.graph.nodes.append(node)
+                self.graph.add_node(node)
 
 
 class ConnectionTool(Tool):
@@ -303,27 +530,39 @@ class ConnectionTool(Tool):
 
     def handle_mouse_down(self, event, double_click=False):
         if event.button == 1:
-            self._start_node = mouse_on_a_node(event.pos, self.graph.nodes)
+            self._start_node = mouse_on_a_node(event.pos, self.graph)
 
     def handle_mouse_up(self, event):
         if event.button == 1 and self._start_node:
-            node = mouse_on_a_node(event.pos, self.graph.nodes)
+            node = mouse_on_a_node(event.pos, self.graph)
             if node is not None and node != self._start_node:
                 self._end_node = node
 
                 # connecting the two nodes
                 connection = Connection((self._start_node, self._end_node))
-                self.graph.connections.append(connection)
+                self.graph.add_connection(connection)
+                repair_decrease(self.graph, connection)
+                self.master.refresh_route()
 
         self._start_node = None
 
     def handle_mouse_move(self, event):
         self._end_pos = event.pos
 
-    def render_preview(self, screen):
+    @property
+    def preview_state(self):
+        if self._start_node is None:
+            return None
+        return (self._start_node, self._start_node.pos, self._end_pos)
+
+    def render_preview(self, screen, camera=None):
         if self._start_node is not None:
             color = (150, 150, 150)
-            draw.line(screen, color, self._start_node.pos, self._end_pos)
+            start_pos, end_pos = self._start_node.pos, self._end_pos
+            if camera is not None:
+                start_pos, end_pos = camera.to_screen(start_pos), camera.to_screen(end_pos)
+            return draw.line(screen, color, start_pos, end_pos)
+        return None
 
 
 class DeleteTool(Tool):
@@ -343,15 +582,11 @@ class DeleteTool(Tool):
         self.master.tool = self
 
     def handle_mouse_down(self, event, double_click=False):
-        node = mouse_on_a_node(event.pos, self.graph.nodes)
+        node = mouse_on_a_node(event.pos, self.graph)
         if node:
-            # Delete the connections of that node
-            connections_to_delete = []
-            for connection in self.graph.connections:
-                if node in connection.nodes:
-                    connections_to_delete.append(connection)
-            for connection in connections_to_delete:
-                self.graph.remove_connection(connection)
-
-            # Delete the node
-            self.graph.nodes.remove(node)
+            # Delete the node and its connections
+            removed = self.graph.remove_node(node)
+            repair_removed_node(self.graph, node, removed)
+            if self.graph.route is not None and node in self.graph.route[:2]:
+                highlight_route(self.graph, None, None, None)
+            self.master.refresh_route()